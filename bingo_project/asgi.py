@@ -13,13 +13,16 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from channels.sessions import SessionMiddlewareStack
 import game.routing
+from game.sharding import ShardGuardMiddleware
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AllowedHostsOriginValidator(
-        SessionMiddlewareStack(
-            URLRouter(
-                game.routing.websocket_urlpatterns
+    "websocket": ShardGuardMiddleware(
+        AllowedHostsOriginValidator(
+            SessionMiddlewareStack(
+                URLRouter(
+                    game.routing.websocket_urlpatterns
+                )
             )
         )
     ),
@@ -98,9 +98,18 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock up front so concurrent DB threads wait instead of failing
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
         }
     }
 
+# Keep connections open across requests and DB pool calls, checking them before reuse
+DATABASES['default']['CONN_MAX_AGE'] = config('CONN_MAX_AGE', default=60, cast=int)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -155,8 +164,14 @@ ASGI_APPLICATION = 'bingo_project.asgi.application'
 # Redis URL from environment variable
 redis_url = config('REDIS_URL', default=None)
 
-# Use Redis for production, InMemory for development
-if redis_url:
+# Room-sharded mode: BINGO_SHARDS worker processes, each owning the rooms whose
+# code hashes to its BINGO_SHARD_INDEX (see game/sharding.py and `runshards`).
+# All of a room's sockets live in one process, so no shared channel layer is needed
+BINGO_SHARDS = config('BINGO_SHARDS', default=1, cast=int)
+BINGO_SHARD_INDEX = config('BINGO_SHARD_INDEX', default=None, cast=lambda v: None if v in (None, '') else int(v))
+
+# Use Redis for production, InMemory for development (and for sharded workers)
+if redis_url and BINGO_SHARDS == 1:
     CHANNEL_LAYERS = {
         "default": {
             "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -172,8 +187,107 @@ else:
         },
     }
 
+# Shared-state mode: several workers serve the same room (e.g. Daphne workers
+# behind Redis), so turns are advanced atomically in the database instead of
+# trusting each worker's in-memory copy of the room
+BINGO_SHARED_STATE = config('BINGO_SHARED_STATE', default=bool(redis_url) and BINGO_SHARDS == 1, cast=bool)
+
+# An empty room is deleted this many seconds after its last socket closes,
+# unless someone reconnects first. Socket counts live in Redis when several
+# workers share rooms, so a socket on any worker keeps the room alive
+BINGO_PRESENCE_GRACE = config('BINGO_PRESENCE_GRACE', default=15.0, cast=float)
+BINGO_PRESENCE_REDIS_URL = config('BINGO_PRESENCE_REDIS_URL', default=redis_url if BINGO_SHARDS == 1 else '') or None
+
+# Stale data purge (game/expiry.py, `manage.py purge_stale`): rooms idle this
+# many seconds, rooms nobody joined within BINGO_ROOM_UNUSED_TTL, and expired
+# sessions are deleted in chunks of BINGO_PURGE_CHUNK rows. Each worker also
+# runs the purge every BINGO_PURGE_INTERVAL seconds (0 disables it)
+BINGO_ROOM_IDLE_TTL = config('BINGO_ROOM_IDLE_TTL', default=6 * 3600, cast=int)
+BINGO_ROOM_UNUSED_TTL = config('BINGO_ROOM_UNUSED_TTL', default=3600, cast=int)
+BINGO_PURGE_CHUNK = config('BINGO_PURGE_CHUNK', default=500, cast=int)
+BINGO_PURGE_INTERVAL = config('BINGO_PURGE_INTERVAL', default=600, cast=int)
+
+# Lifetime in seconds of the signed room tickets that authenticate sockets
+BINGO_TICKET_MAX_AGE = config('BINGO_TICKET_MAX_AGE', default=86400, cast=int)
+
+# Large rooms (game/fanout.py): past this many player sockets in a process,
+# sockets go into sub-groups of this size behind one relay per process, so a
+# broadcast costs the sender the same however big the audience. Spectators
+# always sit behind the relay and get batched updates every
+# BINGO_SPECTATOR_FEED_INTERVAL seconds
+BINGO_FANOUT_GROUP_SIZE = config('BINGO_FANOUT_GROUP_SIZE', default=100, cast=int)
+BINGO_SPECTATOR_FEED_INTERVAL = config('BINGO_SPECTATOR_FEED_INTERVAL', default=0.5, cast=float)
+
+# Event log (game/events.py): live rooms append their events to
+# BINGO_EVENT_LOG_DIR/<code>.log every BINGO_EVENT_LOG_INTERVAL seconds, with a
+# snapshot every BINGO_EVENT_SNAPSHOT_EVERY events. A restarted worker rebuilds
+# rooms from it, and `manage.py replay_games` re-runs logged games. Off (empty
+# dir) in shared-state mode, where no single process sees all of a room's events
+BINGO_EVENT_LOG_DIR = config('BINGO_EVENT_LOG_DIR', default='' if BINGO_SHARED_STATE else str(BASE_DIR / 'eventlog'))
+BINGO_EVENT_LOG_INTERVAL = config('BINGO_EVENT_LOG_INTERVAL', default=0.2, cast=float)
+BINGO_EVENT_SNAPSHOT_EVERY = config('BINGO_EVENT_SNAPSHOT_EVERY', default=100, cast=int)
+
+# permessage-deflate (game/deflate.py), used by `manage.py serve` and
+# runshards: messages shorter than BINGO_WS_DEFLATE_MIN_SIZE bytes (turn
+# messages, binary frames) are sent uncompressed. A smaller window or memory
+# level trades ratio for less zlib memory per socket
+BINGO_WS_DEFLATE = config('BINGO_WS_DEFLATE', default=True, cast=bool)
+BINGO_WS_DEFLATE_MIN_SIZE = config('BINGO_WS_DEFLATE_MIN_SIZE', default=256, cast=int)
+BINGO_WS_DEFLATE_WINDOW_BITS = config('BINGO_WS_DEFLATE_WINDOW_BITS', default=12, cast=int)
+BINGO_WS_DEFLATE_MEM_LEVEL = config('BINGO_WS_DEFLATE_MEM_LEVEL', default=4, cast=int)
+
+# Room codes (game/codes.py): each worker keeps this many codes checked free
+# in the database; codes of deleted rooms are reused after the reuse delay,
+# by when tickets naming the old room have expired
+BINGO_CODE_POOL_SIZE = config('BINGO_CODE_POOL_SIZE', default=256, cast=int)
+BINGO_CODE_REUSE_DELAY = config('BINGO_CODE_REUSE_DELAY', default=BINGO_TICKET_MAX_AGE, cast=int)
+
+# Board edits are written to the database once a board has been left alone
+# this many seconds (and always on ready and on disconnect)
+BINGO_BOARD_SAVE_DELAY = config('BINGO_BOARD_SAVE_DELAY', default=2.0, cast=float)
+
+# Room metadata cache used by views and consumers (LRU with a TTL in seconds).
+# Each process only sees its own invalidations, so with several workers
+# (sharded or shared-state mode) entries live just long enough to absorb
+# a burst of page loads
+BINGO_ROOM_CACHE_SIZE = config('BINGO_ROOM_CACHE_SIZE', default=1024, cast=int)
+BINGO_ROOM_CACHE_TTL = config(
+    'BINGO_ROOM_CACHE_TTL', default=2 if BINGO_SHARDS > 1 or BINGO_SHARED_STATE else 300, cast=float,
+)
+
+# Join/leave/ready changes are merged per room over this window (milliseconds)
+# and sent as one roster_update; 0 sends each change on its own
+BINGO_ROSTER_COALESCE_MS = config('BINGO_ROSTER_COALESCE_MS', default=75, cast=int)
+
+# JSON encoder for client messages: 'auto' uses orjson when installed, else stdlib json
+BINGO_JSON_ENCODER = config('BINGO_JSON_ENCODER', default='auto')
+
+# Thread pools for consumer database work (game/db.py): a general pool, a
+# smaller one reserved for turn-critical writes, and the general-pool backlog
+# beyond which low-priority actions (chat, ready refresh) are rejected
+BINGO_DB_WORKERS = config('BINGO_DB_WORKERS', default=4, cast=int)
+BINGO_DB_CRITICAL_WORKERS = config('BINGO_DB_CRITICAL_WORKERS', default=2, cast=int)
+BINGO_DB_MAX_PENDING = config('BINGO_DB_MAX_PENDING', default=32, cast=int)
+
+# Cache shared by every worker when Redis is available; otherwise Django's
+# per-process default, which must not hold anything another worker can change
+if redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': redis_url,
+        },
+    }
+
 # Session settings
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# cached_db serves session reads from the cache, but only once that cache is
+# shared: a per-process cache would hand one worker a session another worker
+# has since changed. Sockets from the room page carry a signed ticket
+# instead and don't read the session at all
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cached_db' if redis_url else 'django.contrib.sessions.backends.db',
+)
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_SAVE_EVERY_REQUEST = True
 
@@ -1,10 +1,10 @@
 from django.contrib import admin
-from .models import Room, Player
+from .models import Room, Player, Draw
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
     list_display = ['code', 'host_name', 'game_started', 'is_active', 'created_at', 'player_count']
-    list_filter = ['game_started', 'is_active', 'created_at']
+    list_filter = ['game_started', 'is_active', 'auto_detect_winner', 'created_at']
     search_fields = ['code', 'host_name']
     readonly_fields = ['code', 'created_at']
     
@@ -19,3 +19,7 @@ class PlayerAdmin(admin.ModelAdmin):
     search_fields = ['name', 'room__code']
     readonly_fields = ['joined_at']
 
+@admin.register(Draw)
+class DrawAdmin(admin.ModelAdmin):
+    list_display = ['room', 'seq', 'number']
+    search_fields = ['room__code']
@@ -0,0 +1,52 @@
+"""
+Per-process background tasks.
+
+Work that serves every room (write-behind flushes, event log writes,
+cleanup sweeps, purges, fan-out relays) runs in tasks that are started
+lazily from whichever consumer first needs them. Those tasks are detached
+from the consumer action that happened to start them, so their queries and
+time aren't billed to it in the per-action metrics.
+"""
+import asyncio
+from . import metrics
+
+
+async def _detached(coro):
+    metrics.untracked()
+    return await coro
+
+
+def create_task(coro):
+    """Run `coro` in a task on the running loop, outside any consumer action"""
+    return asyncio.get_running_loop().create_task(_detached(coro))
+
+
+class BackgroundLoop:
+    """
+    A singleton's background loop: `run()` is started on first use and
+    restarted if its task ended or belongs to another event loop (a
+    management command or test run with a fresh loop). `_wakeup` is a fresh
+    Event per start that run() may wait on; `wake()` starts the loop and
+    sets it.
+    """
+
+    def __init__(self):
+        self._wakeup = None
+        self._task = None
+
+    def ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self.on_start()
+            self._task = create_task(self.run())
+
+    def wake(self):
+        self.ensure_running()
+        self._wakeup.set()
+
+    def on_start(self):
+        """Create other objects bound to the running loop; called before each start"""
+
+    async def run(self):
+        raise NotImplementedError
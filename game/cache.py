@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from . import metrics
+from .models import Room
+
+
+class RoomInfo:
+    """Cached room metadata: just what the hot lookups need"""
+
+    __slots__ = ('code', 'host_name', 'game_started', 'is_active')
+
+    def __init__(self, code, host_name, game_started=False, is_active=True):
+        self.code = code
+        self.host_name = host_name
+        self.game_started = game_started
+        self.is_active = is_active
+
+    @classmethod
+    def from_room(cls, room):
+        return cls(room.code, room.host_name, room.game_started, room.is_active)
+
+
+class RoomCache:
+    """
+    Process-level room metadata cache keyed by room code.
+
+    Bounded to `max_size` entries (least recently used evicted first) and
+    entries expire `ttl` seconds after they were stored. Writers that change
+    a room's host or started/active flags must update or invalidate the
+    entry. Invalidation only reaches this process, so with several workers
+    (sharded or shared-state mode) the TTL is what bounds staleness, and the
+    roster is not cached at all. Safe to use from sync views and the event
+    loop alike.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or settings.BINGO_ROOM_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.BINGO_ROOM_CACHE_TTL
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, code):
+        """Cached RoomInfo for `code`, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(code)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[code]
+            self.misses += 1
+            return None
+
+    def get_or_load(self, code):
+        """RoomInfo for `code`, loading it from the database on a miss (sync)"""
+        info = self.get(code)
+        if info is not None:
+            return info
+        room = Room.objects.filter(code=code).first()
+        if room is None:
+            return None
+        info = RoomInfo.from_room(room)
+        self.put(info)
+        return info
+
+    def put(self, info):
+        with self._lock:
+            self._entries[info.code] = (time.monotonic() + self.ttl, info)
+            self._entries.move_to_end(info.code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, code, **fields):
+        """Change fields of a cached entry in place; a no-op when the room is not cached"""
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                return
+            info = entry[1]
+            for name, value in fields.items():
+                setattr(info, name, value)
+
+    def invalidate(self, code):
+        with self._lock:
+            self._entries.pop(code, None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'size': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+room_cache = RoomCache()
+
+for _name, _help in (
+    ('size', 'Rooms in the metadata cache'),
+    ('hits', 'Room metadata cache hits'),
+    ('misses', 'Room metadata cache misses'),
+    ('evictions', 'Room metadata cache evictions'),
+):
+    metrics.register(metrics.Gauge(
+        f'bingo_room_cache_{_name}', _help, lambda _name=_name: room_cache.stats()[_name],
+    ))
@@ -0,0 +1,154 @@
+"""
+Central room cleanup.
+
+Rooms are deleted by one background task per process rather than by timers
+hanging off consumers: entries sit in a heap ordered by due time, at most
+one per room and kind, and each sweep deletes every room that came due in
+a single bulk delete.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from channels.layers import get_channel_layer
+from . import metrics, wire
+from .background import BackgroundLoop
+from .cache import room_cache
+from .codes import allocator
+from .db import db_sync_to_async
+from .events import event_log
+from .models import Room
+from .persistence import write_behind
+from .presence import presence
+from .roster import roster
+from .state import discard_room_state, group_name
+
+logger = logging.getLogger(__name__)
+
+# Delete the room unless someone reconnected in the meantime
+EMPTY = 'empty'
+# Warn the room with room_closing, then CLOSE it after the notice period
+CLOSING = 'closing'
+# Delete the room
+CLOSE = 'close'
+
+ROOMS_DELETED = metrics.register(metrics.Counter('bingo_rooms_deleted_total', 'Rooms deleted by cleanup sweeps'))
+
+
+class CleanupScheduler(BackgroundLoop):
+    def __init__(self, closing_notice=5.0, batch_window=1.0):
+        super().__init__()
+        self.closing_notice = closing_notice
+        self.batch_window = batch_window
+        self._heap = []
+        # (code, kind) -> due time; heap entries that disagree are stale
+        self._due = {}
+
+    def schedule(self, code, delay, kind=CLOSE, keep_existing=False):
+        """
+        Run `kind` for the room in `delay` seconds, replacing a pending run of
+        the same kind (or leaving it alone with keep_existing, e.g. when
+        several players claim the same win).
+        """
+        key = (code, kind)
+        if keep_existing and key in self._due:
+            return
+        due = time.monotonic() + delay
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, code, kind))
+        self.ensure_running()
+        if self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def cancel(self, code, kind=None):
+        """Forget pending runs for the room: one kind, or all of them"""
+        kinds = (kind,) if kind is not None else (EMPTY, CLOSING, CLOSE)
+        for k in kinds:
+            self._due.pop((code, k), None)
+
+    @property
+    def pending_count(self):
+        return len(self._due)
+
+    async def run(self):
+        while True:
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Let rooms expiring around the same time (a mass disconnect) share one sweep
+            await asyncio.sleep(self.batch_window)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error in cleanup sweep: {str(e)}")
+
+    def _pop_due(self):
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, code, kind = heapq.heappop(self._heap)
+            if self._due.get((code, kind)) == when:
+                del self._due[(code, kind)]
+                due.append((code, kind))
+        return due
+
+    async def sweep(self):
+        """Handle every entry that has come due; returns the number of rooms deleted"""
+        doomed = {}
+        for code, kind in self._pop_due():
+            if kind == CLOSING:
+                await announce_closing(code)
+                self.schedule(code, self.closing_notice, CLOSE, keep_existing=True)
+            elif kind == EMPTY and await presence.occupied(code):
+                continue
+            else:
+                doomed[code] = None
+        if not doomed:
+            return 0
+        return await close_rooms(list(doomed))
+
+
+scheduler = CleanupScheduler()
+
+metrics.register(metrics.Gauge(
+    'bingo_cleanup_pending', 'Room cleanups waiting in the scheduler', lambda: scheduler.pending_count,
+))
+
+
+async def announce_closing(code):
+    await get_channel_layer().group_send(group_name(code), {
+        'type': 'room_closing',
+        'text': wire.dumps({
+            'type': 'room_closing',
+            'message': 'Game completed! Room will close shortly.'
+        }),
+    })
+
+
+async def close_rooms(codes):
+    """Drop the rooms' live state, then delete them from the database in one go"""
+    for code in codes:
+        scheduler.cancel(code)
+        discard_room_state(code)
+        roster.discard(code)
+        room_cache.invalidate(code)
+        await presence.clear(code)
+    # A batch already in flight may still touch the rooms' rows; let it land first
+    await write_behind.flush()
+    await event_log.flush()
+    event_log.drop(codes)
+    return await delete_rooms(codes)
+
+
+@db_sync_to_async
+def delete_rooms(codes):
+    """Delete rooms with their players and draws (cascade)"""
+    _, deleted = Room.objects.filter(code__in=codes).delete()
+    count = deleted.get(Room._meta.label, 0)
+    ROOMS_DELETED.inc(count)
+    allocator.release(codes)
+    logger.info(f"Deleted {count} room(s) and all player data: {', '.join(codes)}")
+    return count
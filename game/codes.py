@@ -0,0 +1,118 @@
+"""
+Room code allocation.
+
+create_room takes its code from a pool of codes already checked against
+the database, so it never has to find out about a collision from the
+unique constraint. The pool is refilled in bulk, one IN query per batch,
+on a background thread once it runs low. Codes of deleted rooms come back
+after BINGO_CODE_REUSE_DELAY, once tickets and sessions naming the old
+room have expired, and are checked again like any other candidate.
+
+Each process keeps its own pool: two workers could in principle hand out
+the same random code between their checks, but with 36^6 codes that is
+left to the unique constraint.
+"""
+import logging
+import random
+import string
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.db import connections
+from . import metrics
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = string.ascii_uppercase + string.digits
+LENGTH = 6
+
+
+def random_code():
+    return ''.join(random.choices(ALPHABET, k=LENGTH))
+
+
+class CodeAllocator:
+    def __init__(self, size=None, reuse_delay=None):
+        self.size = size or settings.BINGO_CODE_POOL_SIZE
+        self.low_water = max(1, self.size // 4)
+        self.reuse_delay = settings.BINGO_CODE_REUSE_DELAY if reuse_delay is None else reuse_delay
+        self._free = deque()
+        self._pooled = set()
+        # (reusable_at, code) for rooms deleted by this process, oldest first
+        self._freed = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def take(self):
+        """A code no room is using; refills the pool when it runs low"""
+        with self._lock:
+            code = self._pop()
+            start_refill = code is not None and len(self._free) < self.low_water and not self._refilling
+            if start_refill:
+                self._refilling = True
+        if code is None:
+            # Cold pool: nothing to hand out until one batch is checked
+            self.refill()
+            with self._lock:
+                code = self._pop()
+            if code is None:
+                raise RuntimeError('No free room code found')
+        elif start_refill:
+            threading.Thread(target=self._refill_in_background, name='bingo-codes', daemon=True).start()
+        return code
+
+    def release(self, codes):
+        """Offer the codes of deleted rooms for reuse after the reuse delay"""
+        reusable_at = time.monotonic() + self.reuse_delay
+        with self._lock:
+            self._freed.extend((reusable_at, code) for code in codes)
+
+    def refill(self):
+        """Check one batch of candidates against the database and pool the free ones"""
+        with self._lock:
+            candidates = self._reusable()
+        wanted = self.size - len(self._free)
+        candidates.update(random_code() for _ in range(max(wanted - len(candidates), 0)))
+        taken = set(Room.objects.filter(code__in=candidates).values_list('code', flat=True))
+        with self._lock:
+            for code in candidates - taken - self._pooled:
+                self._free.append(code)
+                self._pooled.add(code)
+        return len(candidates) - len(taken)
+
+    @property
+    def pool_size(self):
+        return len(self._free)
+
+    def _pop(self):
+        if not self._free:
+            return None
+        code = self._free.popleft()
+        self._pooled.discard(code)
+        return code
+
+    def _reusable(self):
+        now = time.monotonic()
+        codes = set()
+        while self._freed and self._freed[0][0] <= now:
+            codes.add(self._freed.popleft()[1])
+        return codes
+
+    def _refill_in_background(self):
+        try:
+            self.refill()
+        except Exception as e:
+            logger.error(f"Error refilling room code pool: {str(e)}")
+        finally:
+            self._refilling = False
+            # This thread's connection would otherwise stay open until exit
+            connections.close_all()
+
+
+allocator = CodeAllocator()
+
+metrics.register(metrics.Gauge(
+    'bingo_room_code_pool', 'Checked room codes ready for new rooms', lambda: allocator.pool_size,
+))
@@ -1,20 +1,60 @@
 import json
 import random
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from . import engine, metrics, wire
+from .cache import room_cache
+from .cleanup import scheduler, CLOSING, EMPTY
+from .db import CRITICAL, LOW, DatabaseBusy, db_executor, db_sync_to_async
+from .events import event_log, CLAIM
+from .expiry import periodic_purge
+from .fanout import fanout
 from .models import Room, Player
+from .persistence import write_behind
+from .presence import presence
+from .roster import roster, JOINED, LEFT, READY
+from .state import (
+    get_room_state, peek_room_state, install_room_state, recover_or_load_room_state,
+    refresh_room_state, hold_room_state, release_room_state, group_name,
+)
+from .tickets import read_ticket
 import logging
 
 logger = logging.getLogger(__name__)
 
-class BingoConsumer(AsyncWebsocketConsumer):
+
+class MeteredConsumer(AsyncWebsocketConsumer):
+    """Counts every message and byte sent to the client"""
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        payload = text_data if text_data is not None else bytes_data
+        if payload is not None:
+            metrics.MESSAGES_SENT.inc()
+            if isinstance(payload, str) and not payload.isascii():
+                payload = payload.encode()
+            metrics.BYTES_SENT.inc(len(payload))
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+
+class BingoConsumer(MeteredConsumer):
+    # Whether this socket negotiated wire.BINARY_SUBPROTOCOL for game events
+    binary = False
+
     async def connect(self):
         try:
             self.room_code = self.scope['url_route']['kwargs']['room_code']
-            self.room_group_name = f'bingo_{self.room_code}'
+            self.room_group_name = group_name(self.room_code)
             
-            # Get session data asynchronously
-            session_data = await self.get_session_data()
+            # A signed ticket from the room page spares the session lookup
+            identity = read_ticket(self.scope, self.room_code)
+
+            cached_state = peek_room_state(self.room_code)
+            if cached_state is not None and settings.BINGO_SHARED_STATE:
+                # Other workers may have changed the room since this one last saw it
+                cached_state = await refresh_room_state(self.room_code)
+
+            # Session, player row and room snapshot in a single thread hop
+            session_data, player_id, board, loaded_state = await self.bootstrap(cached_state, identity)
             if not session_data:
                 logger.warning(f"No session found for room {self.room_code}")
                 await self.close(code=4000)
@@ -29,28 +69,42 @@ class BingoConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4000)
                 return
 
-            # Join room group
-            await self.channel_layer.group_add(
-                self.room_group_name,
-                self.channel_name
-            )
+            # Join room group (or, in a large room, one of its sub-groups)
+            self.membership = await fanout.join(self.room_code, self.channel_name)
             
-            await self.accept()
+            # Binary frames name players by slot, which is only this process's join
+            # order; workers sharing a room number slots differently, so they speak JSON
+            self.binary = (
+                not settings.BINGO_SHARED_STATE and wire.BINARY_SUBPROTOCOL in self.scope.get('subprotocols', ())
+            )
+            await self.accept(subprotocol=wire.BINARY_SUBPROTOCOL if self.binary else None)
+            periodic_purge.ensure_running()
 
-            # Get or create player with board
-            player_id, board, is_new = await self.get_or_create_player()
-            
             if not player_id:
                 logger.error(f"Failed to create player {self.user_name} in room {self.room_code}")
                 await self.close(code=4001)
                 return
-            
-            # Send empty board if new player, otherwise send saved board
-            if not board:
-                board = []  # Empty board - player will fill it
-            
+            self.player_id = player_id
+
+            # Attach to the room's live state
+            if loaded_state is not None:
+                self.room_state = install_room_state(loaded_state)
+            else:
+                self.room_state = await get_room_state(self.room_code)
+            if self.room_state is None:
+                logger.error(f"Room {self.room_code} was closed while {self.user_name} was joining")
+                await self.close(code=4001)
+                return
+            hold_room_state(self.room_code)
+            self.attached = True
+            self.room_state.add_player(self.user_name, is_host=self.is_host, board=board, player_id=player_id)
+            self.room_state.set_connected(self.user_name, True)
+            await presence.join(self.room_code, self.user_name)
+            scheduler.cancel(self.room_code, EMPTY)
+            self.present = True
+
             # Send initial data to the connecting user
-            room_data = await self.get_room_data()
+            room_data = self.get_room_data()
             await self.send(text_data=json.dumps({
                 'type': 'game_init',
                 'board': board,
@@ -60,14 +114,7 @@ class BingoConsumer(AsyncWebsocketConsumer):
             }))
 
             # Notify others that a new player joined
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'player_joined',
-                    'player_name': self.user_name,
-                    'is_host': self.is_host
-                }
-            )
+            await roster.note(self.room_state, self.room_group_name, JOINED, self.user_name)
             
             logger.info(f"Player {self.user_name} connected to room {self.room_code}")
             
@@ -78,62 +125,53 @@ class BingoConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         logger.info(f"Player {getattr(self, 'user_name', 'Unknown')} disconnected from room {getattr(self, 'room_code', 'Unknown')} with code {close_code}")
         
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+        if hasattr(self, 'membership'):
+            await fanout.leave(self.room_code, self.channel_name, self.membership)
         
-        # Mark player as disconnected
-        if hasattr(self, 'user_name') and hasattr(self, 'room_code'):
-            await self.mark_player_disconnected()
-            
-            # Check if all players have disconnected, if so delete the room
-            all_disconnected = await self.check_all_disconnected()
-            if all_disconnected:
-                await self.cleanup_room()
+        if getattr(self, 'present', False):
+            # The player is gone once their last socket closes; an empty room is
+            # deleted after a grace period unless someone reconnects
+            player_gone, room_empty = await presence.leave(self.room_code, self.user_name)
+            if player_gone:
+                self.mark_player_disconnected()
+            if room_empty:
+                scheduler.schedule(self.room_code, settings.BINGO_PRESENCE_GRACE, EMPTY)
+            elif player_gone:
+                await roster.note(self.room_state, self.room_group_name, LEFT, self.user_name)
+            # Persist any board edits still waiting on the debounce timer
+            await write_behind.flush()
+
+        if getattr(self, 'attached', False):
+            release_room_state(self.room_code)
+
+    ACTIONS = frozenset({
+        'start_game', 'player_ready', 'generate_random_board', 'clear_board', 'manual_fill_cell',
+        'select_number', 'resync', 'claim_bingo', 'chat_message',
+    })
+    # Lobby traffic shed first when the database pool is saturated
+    LOW_PRIORITY_ACTIONS = frozenset({'player_ready', 'chat_message'})
+
+    async def websocket_connect(self, message):
+        with metrics.track_action('connect'):
+            await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        with metrics.track_action('disconnect'):
+            await super().websocket_disconnect(message)
 
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             action = data.get('action')
-
-            if action == 'start_game':
-                if self.is_host:
-                    await self.start_game()
-            
-            elif action == 'player_ready':
-                await self.handle_player_ready()
-            
-            elif action == 'generate_random_board':
-                await self.handle_generate_random_board()
-            
-            elif action == 'clear_board':
-                await self.handle_clear_board()
-            
-            elif action == 'manual_fill_cell':
-                cell_index = data.get('cell_index')
-                if cell_index is not None:
-                    await self.handle_manual_fill_cell(cell_index)
-            
-            elif action == 'select_number':
-                number = data.get('number')
-                if number:
-                    await self.handle_number_selection(number)
-            
-            elif action == 'claim_bingo':
-                board_state = data.get('board_state', [])
-                await self.check_bingo(board_state)
-            
-            elif action == 'chat_message':
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': data['message'],
-                        'sender': self.user_name
-                    }
-                )
+            if action in self.LOW_PRIORITY_ACTIONS and db_executor.saturated:
+                raise DatabaseBusy()
+            with metrics.track_action(action if action in self.ACTIONS else 'unknown'):
+                await self.handle_action(action, data)
+        except DatabaseBusy:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Server is busy, please try again in a moment'
+            }))
         except Exception as e:
             logger.error(f"Error in receive: {str(e)}")
             await self.send(text_data=json.dumps({
@@ -141,9 +179,46 @@ class BingoConsumer(AsyncWebsocketConsumer):
                 'message': 'An error occurred processing your request'
             }))
 
-    @database_sync_to_async
+    async def handle_action(self, action, data):
+        if action == 'start_game':
+            if self.is_host:
+                await self.start_game()
+        
+        elif action == 'player_ready':
+            await self.handle_player_ready()
+        
+        elif action == 'generate_random_board':
+            await self.handle_generate_random_board()
+        
+        elif action == 'clear_board':
+            await self.handle_clear_board()
+        
+        elif action == 'manual_fill_cell':
+            cell_index = data.get('cell_index')
+            if cell_index is not None:
+                await self.handle_manual_fill_cell(cell_index)
+        
+        elif action == 'select_number':
+            number = data.get('number')
+            if number:
+                await self.handle_number_selection(number)
+        
+        elif action == 'resync':
+            await self.send_draw_snapshot()
+        
+        elif action == 'claim_bingo':
+            board_state = data.get('board_state', [])
+            await self.check_bingo(board_state)
+        
+        elif action == 'chat_message':
+            await self.broadcast('chat_message', {
+                'type': 'chat',
+                'message': data['message'],
+                'sender': self.user_name
+            })
+
     def get_session_data(self):
-        """Get session data asynchronously to avoid sync/async conflict"""
+        """Read the user's session (sync: the session store loads lazily)"""
         try:
             session = self.scope.get('session', {})
             return {
@@ -154,133 +229,75 @@ class BingoConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error getting session data: {str(e)}")
             return None
 
-    @database_sync_to_async
-    def get_or_create_player(self):
+    @db_sync_to_async
+    def bootstrap(self, cached_state, identity=None):
+        """
+        Everything connect() needs from the database in one thread hop: the
+        session (unless a ticket already gave the `identity`), the player row
+        (created or marked connected) and, when this process does not hold
+        the room yet, the room snapshot.
+
+        Returns (session_data, player_id, board, loaded_state); player_id is
+        None when the room does not exist.
+        """
+        session_data = identity or self.get_session_data()
+        if not session_data or not session_data.get('user_name'):
+            return session_data, None, [], None
+        user_name = session_data['user_name']
+
         try:
-            room = Room.objects.get(code=self.room_code)
+            loaded_state = None
+            state = cached_state
+            if state is None:
+                state = loaded_state = recover_or_load_room_state(self.room_code)
+                if state is None:
+                    logger.error(f"Room {self.room_code} does not exist")
+                    return session_data, None, [], None
+
+            # Known player: a single UPDATE marks them connected
+            slot = state.by_name.get(user_name)
+            if slot is not None and slot.player_id:
+                Player.objects.filter(pk=slot.player_id).update(is_connected=True, channel_name=self.channel_name)
+                return session_data, slot.player_id, slot.board, loaded_state
+
             player, created = Player.objects.get_or_create(
-                room=room,
-                name=self.user_name,
+                room_id=state.room_id,
+                name=user_name,
                 defaults={
-                    'is_host': self.is_host,
+                    'is_host': session_data.get('is_host', False),
                     'channel_name': self.channel_name,
                     'is_connected': True
                 }
             )
-            
-            # If not created, update connection status
             if not created:
                 player.is_connected = True
                 player.channel_name = self.channel_name
-                player.save()
-            
-            # Get board data
-            board = []
-            if player.board_state:
-                board = json.loads(player.board_state)
-            
-            # Return player id, board, and whether it needs a new board
-            needs_board = created and not board
-            return player.id, board, needs_board
-            
-        except Room.DoesNotExist:
-            logger.error(f"Room {self.room_code} does not exist")
-            return None, [], False
+                player.save(update_fields=['is_connected', 'channel_name'])
+            return session_data, player.pk, player.get_board(), loaded_state
+
         except Exception as e:
-            logger.error(f"Error in get_or_create_player: {str(e)}")
-            return None, [], False
+            logger.error(f"Error in bootstrap: {str(e)}")
+            return session_data, None, [], None
     
-    @database_sync_to_async
-    def save_player_board(self, player_id, board):
-        try:
-            player = Player.objects.get(id=player_id)
-            player.board_state = json.dumps(board)
-            player.save()
-        except Player.DoesNotExist:
-            logger.error(f"Player {player_id} not found")
-        except Exception as e:
-            logger.error(f"Error saving board: {str(e)}")
+    def save_player_board(self, board):
+        """Update the board in the room state; the database write is debounced"""
+        self.room_state.set_board(self.user_name, board)
 
-    @database_sync_to_async
-    def check_all_disconnected(self):
-        """Check if all players in the room are disconnected"""
-        try:
-            room = Room.objects.get(code=self.room_code)
-            connected_count = room.players.filter(is_connected=True).count()
-            return connected_count == 0
-        except Room.DoesNotExist:
-            return True
-    
-    @database_sync_to_async
-    def cleanup_room(self):
-        """Delete room and all associated player data"""
-        try:
-            room = Room.objects.get(code=self.room_code)
-            # Delete all players (cascade will handle this, but explicit is better)
-            room.players.all().delete()
-            # Delete the room
-            room.delete()
-            logger.info(f"Room {self.room_code} and all player data deleted from database")
-            return True
-        except Room.DoesNotExist:
-            logger.warning(f"Room {self.room_code} not found for cleanup")
-            return False
-    
-    async def delayed_cleanup(self, delay_seconds):
-        """Cleanup room after a delay (for winner announcement)"""
-        import asyncio
-        await asyncio.sleep(delay_seconds)
-        
-        # Send notification before cleanup
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'room_closing',
-                'message': 'Game completed! Room will close shortly.'
-            }
-        )
-        
-        # Wait a bit more for the message to be delivered
-        await asyncio.sleep(5)
-        
-        # Cleanup the room
-        await self.cleanup_room()
+    def get_player_board(self):
+        return list(self.room_state.by_name[self.user_name].board)
 
-    @database_sync_to_async
     def mark_player_disconnected(self):
-        Player.objects.filter(
-            room__code=self.room_code,
-            name=self.user_name
-        ).update(is_connected=False)
+        self.room_state.set_connected(self.user_name, False)
 
-    @database_sync_to_async
     def get_room_data(self):
-        try:
-            room = Room.objects.get(code=self.room_code)
-            players = list(room.players.all().values('name', 'is_host', 'is_connected', 'is_ready'))
-            
-            # Parse drawn numbers
-            drawn_numbers = []
-            if room.drawn_numbers:
-                drawn_numbers = [int(n) for n in room.drawn_numbers.split(',') if n]
-            
-            return {
-                'host_name': room.host_name,
-                'game_started': room.game_started,
-                'current_number': room.current_number,
-                'drawn_numbers': drawn_numbers,
-                'players': players,
-                'current_turn_player': room.current_turn_player
-            }
-        except Room.DoesNotExist:
-            return {}
-        except Exception as e:
-            logger.error(f"Error in get_room_data: {str(e)}")
-            return {}
+        return self.room_state.snapshot()
 
     async def start_game(self):
+        if settings.BINGO_SHARED_STATE:
+            await refresh_room_state(self.room_code)
+
         # Check if all players are ready
-        all_ready, not_ready_players = await self.check_all_players_ready()
+        all_ready, not_ready_players = self.check_all_players_ready()
         if not all_ready:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -288,21 +305,24 @@ class BingoConsumer(AsyncWebsocketConsumer):
             }))
             return
         
-        success, current_turn_player = await self.mark_game_started()
+        success, current_turn_player = self.mark_game_started()
+        if success and settings.BINGO_SHARED_STATE:
+            # Other workers advance turns from the database, so it must be current
+            await write_behind.flush()
         if success:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'game_started',
-                    'message': 'Game has started! Good luck!',
-                    'current_turn_player': current_turn_player
-                }
-            )
+            # Clients must see the final roster before the game starts
+            await roster.flush(self.room_code)
+            await self.broadcast('game_started', {
+                'type': 'game_started',
+                'message': 'Game has started! Good luck!',
+                'current_turn_player': current_turn_player
+            }, binary=wire.frame(wire.GAME_STARTED, turn=self.room_state.turn_slot),
+                current_turn_player=current_turn_player)
     
     async def handle_player_ready(self):
         """Mark player as ready and broadcast to all"""
         # Check if board is filled
-        board_filled = await self.check_player_board_filled()
+        board_filled = self.check_player_board_filled()
         if not board_filled:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -310,47 +330,36 @@ class BingoConsumer(AsyncWebsocketConsumer):
             }))
             return
         
-        success = await self.mark_player_ready()
+        success = self.mark_player_ready()
         if success:
+            # Persist the finished board (and ready flag) now rather than on the debounce timer
+            await write_behind.flush()
+            if settings.BINGO_SHARED_STATE:
+                await refresh_room_state(self.room_code, priority=LOW)
+
             # Broadcast ready status to all players
-            ready_status = await self.get_ready_status()
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'player_ready_update',
-                    'player_name': self.user_name,
-                    'ready_status': ready_status
-                }
-            )
+            await roster.note(self.room_state, self.room_group_name, READY, self.user_name)
     
     async def handle_generate_random_board(self):
         """Generate a random board for the player"""
         board = self.generate_bingo_board()
-        player_id = await self.get_player_id()
-        if player_id:
-            await self.save_player_board(player_id, board)
-            await self.send(text_data=json.dumps({
-                'type': 'board_generated',
-                'board': board
-            }))
+        self.save_player_board(board)
+        await self.send(text_data=json.dumps({
+            'type': 'board_generated',
+            'board': board
+        }))
     
     async def handle_clear_board(self):
         """Clear the player's board"""
-        player_id = await self.get_player_id()
-        if player_id:
-            await self.save_player_board(player_id, [])
-            await self.send(text_data=json.dumps({
-                'type': 'board_cleared'
-            }))
+        self.save_player_board([])
+        await self.send(text_data=json.dumps({
+            'type': 'board_cleared'
+        }))
     
     async def handle_manual_fill_cell(self, cell_index):
         """Fill a cell with the next sequential number (1-25)"""
-        player_id = await self.get_player_id()
-        if not player_id:
-            return
-        
         # Get current board
-        current_board = await self.get_player_board(player_id)
+        current_board = self.get_player_board()
         if not current_board:
             current_board = [0] * 25  # Initialize empty board with 0s
         
@@ -376,7 +385,7 @@ class BingoConsumer(AsyncWebsocketConsumer):
         current_board[cell_index] = next_number
         
         # Save the board
-        await self.save_player_board(player_id, current_board)
+        self.save_player_board(current_board)
         
         await self.send(text_data=json.dumps({
             'type': 'cell_filled',
@@ -385,69 +394,20 @@ class BingoConsumer(AsyncWebsocketConsumer):
             'board': current_board
         }))
 
-    @database_sync_to_async
-    def get_player_id(self):
-        try:
-            player = Player.objects.get(room__code=self.room_code, name=self.user_name)
-            return player.id
-        except Player.DoesNotExist:
-            return None
-    
-    @database_sync_to_async
-    def get_player_board(self, player_id):
-        try:
-            player = Player.objects.get(id=player_id)
-            if player.board_state:
-                return json.loads(player.board_state)
-            return []
-        except Player.DoesNotExist:
-            return []
-    
-    @database_sync_to_async
     def check_player_board_filled(self):
         """Check if current player's board is filled"""
-        try:
-            player = Player.objects.get(room__code=self.room_code, name=self.user_name)
-            if not player.board_state:
-                return False
-            board = json.loads(player.board_state)
-            return len(board) == 25 and all(n > 0 for n in board)
-        except Player.DoesNotExist:
-            return False
+        return engine.is_full_board(self.room_state.by_name[self.user_name].board)
     
-    @database_sync_to_async
     def mark_player_ready(self):
         """Mark player as ready"""
-        try:
-            player = Player.objects.get(room__code=self.room_code, name=self.user_name)
-            player.is_ready = True
-            player.save()
-            return True
-        except Player.DoesNotExist:
-            return False
+        return self.room_state.set_ready(self.user_name)
     
-    @database_sync_to_async
-    def get_ready_status(self):
-        """Get list of all players with their ready status"""
-        try:
-            room = Room.objects.get(code=self.room_code)
-            players = room.players.filter(is_connected=True).values('name', 'is_ready')
-            return list(players)
-        except Room.DoesNotExist:
-            return []
-    
-    @database_sync_to_async
     def check_all_players_ready(self):
         """Check if all connected players are ready"""
-        try:
-            room = Room.objects.get(code=self.room_code)
-            players = room.players.filter(is_connected=True)
-            not_ready = [p.name for p in players if not p.is_ready]
-            return len(not_ready) == 0, ', '.join(not_ready)
-        except Room.DoesNotExist:
-            return False, "Room not found"
+        not_ready = self.room_state.not_ready_players()
+        return len(not_ready) == 0, ', '.join(not_ready)
 
-    @database_sync_to_async
+    @db_sync_to_async
     def check_all_boards_filled(self):
         """Check if all connected players have filled their boards (25 numbers)"""
         try:
@@ -455,220 +415,162 @@ class BingoConsumer(AsyncWebsocketConsumer):
             players = room.players.filter(is_connected=True)
             
             for player in players:
-                if not player.board_state:
-                    return False
-                board = json.loads(player.board_state)
                 # Check if board has 25 valid numbers
-                if len(board) != 25 or any(n <= 0 for n in board):
+                if not engine.is_full_board(player.get_board()):
                     return False
             
             return True
         except Room.DoesNotExist:
             return False
 
-    @database_sync_to_async
     def mark_game_started(self):
-        try:
-            room = Room.objects.get(code=self.room_code)
-            if not room.game_started:
-                room.game_started = True
-                # Set first connected player as the starting turn
-                first_player = room.players.filter(is_connected=True).order_by('id').first()
-                if first_player:
-                    room.current_turn_player = first_player.name
-                room.save()
-                return True, room.current_turn_player
-            return False, room.current_turn_player
-        except Room.DoesNotExist:
-            return False, ""
+        # The first connected player takes the starting turn
+        success = self.room_state.start()
+        if success:
+            room_cache.update(self.room_code, game_started=True)
+        return success, self.room_state.current_turn_player
 
     async def handle_number_selection(self, number):
         """Handle when a player selects a number from their board"""
-        # Check if this player can select (turn-based)
-        can_select, message, _ = await self.check_player_turn()
-        
-        if not can_select:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': message
-            }))
-            return
-        
-        success, drawn_numbers, next_turn_player = await self.mark_number_as_called(number)
-        if success:
-            # Broadcast the selected number to all players
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'number_called',
-                    'number': number,
-                    'drawn_numbers': drawn_numbers,
-                    'selected_by': self.user_name,
-                    'current_turn_player': next_turn_player
-                }
-            )
+        if settings.BINGO_SHARED_STATE:
+            result = await self.mark_number_as_called_shared(number)
         else:
+            result = self.mark_number_as_called(number)
+
+        if result != engine.DRAW_OK:
             await self.send(text_data=json.dumps({
                 'type': 'error',
-                'message': 'This number has already been selected!'
+                'message': self.draw_rejection_message(result)
             }))
+            return
 
-    @database_sync_to_async
-    def check_player_turn(self):
-        """Check if this player can select a number (strict turn-based)"""
-        try:
-            room = Room.objects.get(code=self.room_code)
-            
-            # Check if it's this player's turn
-            if room.current_turn_player != self.user_name:
-                return False, f"It's {room.current_turn_player}'s turn!", False
-            
-            return True, "", False
-            
-        except Room.DoesNotExist:
-            return False, "Room not found", False
-        except Exception as e:
-            logger.error(f"Error in check_player_turn: {str(e)}")
-            return False, "Error checking turn", False
+        # Broadcast only the new number; clients that miss a seq ask for a resync
+        state = self.room_state
+        await self.broadcast('number_called', {
+            'type': 'number_called',
+            'seq': state.seq,
+            'number': number,
+            'selected_by': self.user_name,
+            'current_turn_player': state.current_turn_player
+        }, binary=wire.frame(
+            wire.NUMBER_CALLED, state.seq, number, state.by_name[self.user_name].slot, state.turn_slot
+        ), seq=state.seq, number=number, current_turn_player=state.current_turn_player, version=state.version)
+
+        # In auto-detect rooms the server announces the winner itself
+        if state.auto_detect_winner:
+            winner = state.detect_winner(self.user_name)
+            if winner and state.declare_winner(winner):
+                await self.announce_winner(winner)
+
+    def draw_rejection_message(self, result):
+        if result == engine.DRAW_NOT_YOUR_TURN:
+            return f"It's {self.room_state.current_turn_player}'s turn!"
+        if result == engine.DRAW_ALREADY_CALLED:
+            return 'This number has already been selected!'
+        if result == engine.DRAW_CONFLICT:
+            return 'Another move was made at the same time. Please try again.'
+        return 'That number cannot be selected.'
 
-    @database_sync_to_async
     def get_player_count(self):
         """Get total number of connected players"""
-        try:
-            room = Room.objects.get(code=self.room_code)
-            return room.players.filter(is_connected=True).count()
-        except Room.DoesNotExist:
-            return 0
-        except Exception as e:
-            logger.error(f"Error getting player count: {str(e)}")
-            return 0
+        return len(self.room_state.connected_players())
 
-    @database_sync_to_async
     def mark_number_as_called(self, number):
-        """Mark a number as called/selected by a player"""
+        """Mark a number as called/selected and rotate to the next connected player"""
+        return self.room_state.draw(number, self.user_name)
+
+    async def mark_number_as_called_shared(self, number):
+        """
+        Shared-state mode: several workers serve the same room, so the turn is
+        advanced atomically in the database and the local state follows it.
+        """
+        state = self.room_state
+        result = state.check_draw(number, self.user_name)
+        if result in (engine.DRAW_INVALID, engine.DRAW_ALREADY_CALLED):
+            return result
+
         try:
-            room = Room.objects.get(code=self.room_code)
-            
-            # Get drawn numbers
-            drawn = []
-            if room.drawn_numbers:
-                drawn = [int(n) for n in room.drawn_numbers.split(',') if n]
-            
-            # Check if number already called
-            if number in drawn:
-                return False, drawn, room.current_turn_player
-            
-            # Mark number as called
-            drawn.append(number)
-            room.drawn_numbers = ','.join(map(str, drawn))
-            room.current_number = number
-            
-            # Rotate to next player
-            connected_players = list(room.players.filter(is_connected=True).order_by('id').values_list('name', flat=True))
-            if connected_players:
-                try:
-                    current_index = connected_players.index(self.user_name)
-                    next_index = (current_index + 1) % len(connected_players)
-                    room.current_turn_player = connected_players[next_index]
-                except ValueError:
-                    # Current player not in list, set first player
-                    room.current_turn_player = connected_players[0]
-            
-            room.save()
-            
-            return True, drawn, room.current_turn_player
+            result, room = await db_sync_to_async(Room.advance_turn, priority=CRITICAL)(self.room_code, self.user_name, number)
         except Room.DoesNotExist:
-            return False, [], ""
-        except Exception as e:
-            logger.error(f"Error in mark_number_as_called: {str(e)}")
-            return False, [], ""
+            return engine.DRAW_INVALID
+
+        if result == engine.DRAW_OK and room.version == state.version + 1:
+            state.record_draw(number, room.current_turn_player, room.version)
+        else:
+            # Our copy is behind another worker's moves
+            await refresh_room_state(self.room_code)
+        return result
+
+    async def send_draw_snapshot(self):
+        """Send the full list of drawn numbers to a client that reported a sequence gap"""
+        state = self.room_state
+        await self.send(text_data=json.dumps({
+            'type': 'draw_snapshot',
+            'seq': state.seq,
+            'drawn_numbers': list(state.drawn),
+            'current_number': state.current_number,
+            'current_turn_player': state.current_turn_player
+        }))
 
     async def check_bingo(self, board_state):
-        is_valid, complete_lines = await self.validate_bingo(board_state)
-        
+        if self.room_state.auto_detect_winner:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Winners are announced automatically in this room.'
+            }))
+            return
+
+        is_valid, complete_lines = self.validate_bingo(board_state)
+        event_log.record(self.room_state, CLAIM, self.user_name, complete_lines)
+
         if is_valid:
-            # Announce winner
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'bingo_winner',
-                    'winner': self.user_name
-                }
-            )
-            
-            # Schedule room cleanup after 30 seconds to allow players to see results
-            # Note: In production, you might want to use Celery or similar for scheduled tasks
-            import asyncio
-            asyncio.create_task(self.delayed_cleanup(30))
+            if self.room_state.declare_winner(self.user_name):
+                await self.announce_winner(self.user_name)
         else:
             await self.send(text_data=json.dumps({
                 'type': 'invalid_bingo',
                 'message': f'Invalid BINGO! You need 5 complete lines. You have {complete_lines} lines.'
             }))
 
-    @database_sync_to_async
+    async def announce_winner(self, winner):
+        if settings.BINGO_SHARED_STATE:
+            # Other workers check the database for a winner before accepting a draw
+            await write_behind.flush()
+        await self.broadcast('bingo_winner', {
+            'type': 'bingo_winner',
+            'winner': winner
+        }, binary=wire.frame(wire.BINGO_WINNER, slot=self.room_state.by_name[winner].slot), winner=winner)
+
+        # Close the room after 30 seconds to allow players to see results
+        scheduler.schedule(self.room_code, 30, CLOSING, keep_existing=True)
+
     def validate_bingo(self, board_state):
         """
         board_state is a list of dicts: [{'number': 5, 'marked': True}, ...]
         Indian Bingo: Check if player has 5 complete lines
+
+        The server keeps its own scorecard for every filled board, so the
+        claim is checked against that; the submitted board_state is only
+        used for players whose board the server has not scored.
         """
-        try:
-            room = Room.objects.get(code=self.room_code)
-            
-            # Parse drawn numbers
-            drawn = set()
-            if room.drawn_numbers:
-                drawn = set([int(n) for n in room.drawn_numbers.split(',') if n])
-            
-            # Extract marked numbers and validate they were called
-            marked_positions = []
-            for idx, cell in enumerate(board_state):
-                if cell.get('marked'):
-                    number = cell.get('number')
-                    # Check if this number was actually drawn
-                    if number not in drawn:
-                        return False, 0
-                    marked_positions.append(idx)
-            
-            # Check if marked positions form 5 complete lines (Indian Bingo rule)
-            complete_lines = self.count_complete_lines(marked_positions)
-            if complete_lines >= 5:
-                return True, complete_lines
-            
-            return False, complete_lines
-        except Room.DoesNotExist:
-            return False, []
+        state = self.room_state
+        if self.user_name in state.cards:
+            complete_lines = state.lines_for(self.user_name)
+            return complete_lines >= engine.WINNING_LINES, complete_lines
 
-    def count_complete_lines(self, marked_positions):
-        """Count complete lines (rows, columns, diagonals) - Indian Bingo needs 5 lines to win"""
-        if len(marked_positions) < 5:
-            return 0
-        
-        marked_set = set(marked_positions)
-        complete_lines = 0
-        
-        # Check rows (0-4, 5-9, 10-14, 15-19, 20-24)
-        for row in range(5):
-            row_indices = set(range(row * 5, row * 5 + 5))
-            if row_indices.issubset(marked_set):
-                complete_lines += 1
-        
-        # Check columns
-        for col in range(5):
-            col_indices = set(range(col, 25, 5))
-            if col_indices.issubset(marked_set):
-                complete_lines += 1
-        
-        # Check diagonals
-        diagonal1 = {0, 6, 12, 18, 24}  # Top-left to bottom-right
-        diagonal2 = {4, 8, 12, 16, 20}  # Top-right to bottom-left
-        
-        if diagonal1.issubset(marked_set):
-            complete_lines += 1
-        if diagonal2.issubset(marked_set):
-            complete_lines += 1
-        
-        return complete_lines
+        # Extract marked numbers and validate they were called
+        marked_positions = []
+        for idx, cell in enumerate(board_state[:engine.CELL_COUNT]):
+            if cell.get('marked'):
+                number = cell.get('number')
+                # Check if this number was actually drawn
+                if not isinstance(number, int) or not 0 < number <= engine.CELL_COUNT or not state.is_drawn(number):
+                    return False, 0
+                marked_positions.append(idx)
+
+        # Check if marked positions form 5 complete lines (Indian Bingo rule)
+        complete_lines = engine.count_lines(engine.positions_mask(marked_positions))
+        return complete_lines >= engine.WINNING_LINES, complete_lines
 
     def generate_bingo_board(self):
         """Generate Indian Bingo board: 25 random numbers from 1-25"""
@@ -676,52 +578,102 @@ class BingoConsumer(AsyncWebsocketConsumer):
         board = random.sample(range(1, 26), 25)
         return board
 
+    async def broadcast(self, handler, payload, binary=None, **fields):
+        """
+        Encode a client message once and fan it out to the room group.
+        `binary` is the same event as a wire.frame() for binary-protocol
+        sockets. Extra `fields` travel alongside the encoded text for the
+        handlers.
+        """
+        message = {
+            'type': handler,
+            'text': wire.dumps(payload),
+            **fields
+        }
+        if binary is not None:
+            message['bytes'] = binary
+        await self.channel_layer.group_send(self.room_group_name, message)
+
+    async def forward(self, event):
+        """Pass a broadcast on: as its binary frame if this socket speaks the binary protocol"""
+        if self.binary and 'bytes' in event:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
+
     # Handler methods for group messages
-    async def player_joined(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'player_joined',
-            'player_name': event['player_name'],
-            'is_host': event.get('is_host', False)
-        }))
+    # Payloads arrive pre-encoded by broadcast() and are forwarded unchanged
+    async def roster_update(self, event):
+        await self.send(text_data=event['text'])
 
     async def game_started(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'game_started',
-            'message': event['message'],
-            'current_turn_player': event.get('current_turn_player', '')
-        }))
+        if settings.BINGO_SHARED_STATE and hasattr(self, 'room_state') and not self.room_state.game_started:
+            self.room_state.sync_start(event['current_turn_player'])
+            # Boards are frozen from here on, and any worker may score a draw:
+            # load every board once (the first socket here to see the start does it)
+            await refresh_room_state(self.room_code, priority=CRITICAL)
+        await self.forward(event)
 
     async def number_called(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'number_called',
-            'number': event['number'],
-            'drawn_numbers': event['drawn_numbers'],
-            'selected_by': event.get('selected_by'),
-            'current_turn_player': event.get('current_turn_player', '')
-        }))
+        if settings.BINGO_SHARED_STATE and hasattr(self, 'room_state'):
+            # Keep this worker's copy of the room in step with the draw
+            synced = self.room_state.sync_draw(
+                event['seq'], event['number'], event['current_turn_player'], event['version']
+            )
+            if not synced:
+                await refresh_room_state(self.room_code, priority=CRITICAL)
+        await self.forward(event)
 
     async def bingo_winner(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'bingo_winner',
-            'winner': event['winner']
-        }))
+        if settings.BINGO_SHARED_STATE and hasattr(self, 'room_state'):
+            self.room_state.sync_winner(event['winner'])
+        await self.forward(event)
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'chat',
-            'message': event['message'],
-            'sender': event['sender']
-        }))
-    
-    async def player_ready_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'player_ready_update',
-            'player_name': event['player_name'],
-            'ready_status': event['ready_status']
-        }))
+        await self.send(text_data=event['text'])
     
     async def room_closing(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'room_closing',
-            'message': event['message']
-        }))
\ No newline at end of file
+        await self.send(text_data=event['text'])
+
+
+class SpectatorConsumer(MeteredConsumer):
+    """
+    Read-only socket for watching a room. It needs no session, creates no
+    player, writes nothing and installs no live state: the opening snapshot
+    is the fan-out's cached pre-encoded frame (read once per room event, not
+    per watcher), and updates arrive as the room's rate-limited spectator feed.
+    """
+
+    async def websocket_connect(self, message):
+        with metrics.track_action('watch'):
+            await super().websocket_connect(message)
+
+    async def connect(self):
+        self.room_code = self.scope['url_route']['kwargs']['room_code']
+        # Subscribe before taking the snapshot, so no update falls in between
+        self.membership = await fanout.join(self.room_code, self.channel_name, spectator=True)
+        snapshot = await fanout.snapshot(self.room_code)
+        if snapshot is None:
+            logger.warning(f"Spectator refused: room {self.room_code} does not exist")
+            await self.close(code=4001)
+            return
+        await self.accept()
+        await self.send(text_data=snapshot)
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'membership'):
+            await fanout.leave(self.room_code, self.channel_name, self.membership)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Watchers can only ask for the snapshot again, e.g. after missing a draw
+        try:
+            data = json.loads(text_data or '')
+        except ValueError:
+            return
+        if isinstance(data, dict) and data.get('action') == 'resync':
+            snapshot = await fanout.snapshot(self.room_code)
+            if snapshot is not None:
+                await self.send(text_data=snapshot)
+
+    async def spectator_feed(self, event):
+        await self.send(text_data=event['text'])
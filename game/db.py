@@ -0,0 +1,109 @@
+"""
+Thread pools for the game's database work.
+
+Consumers don't use asgiref's shared sync executor: turn-critical writes
+(draws, write-behind flushes) get a small pool of their own so they never
+queue behind lobby traffic, and everything else shares a bounded general
+pool. When the general pool is saturated, low-priority work (chat, ready
+status refreshes) is turned away with DatabaseBusy instead of piling up.
+
+Worker threads keep their connections between calls; CONN_MAX_AGE and
+CONN_HEALTH_CHECKS in settings.py decide when they are recycled.
+"""
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import database_sync_to_async
+from django.conf import settings
+from . import metrics
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+
+REJECTED = metrics.register(metrics.Counter(
+    'bingo_db_rejected_total', 'Low-priority database calls turned away while saturated',
+))
+
+
+class DatabaseBusy(Exception):
+    """Raised instead of queueing low-priority work on a saturated pool"""
+
+
+class DatabaseExecutor:
+    def __init__(self, workers=None, critical_workers=None, max_pending=None):
+        self.workers = workers or settings.BINGO_DB_WORKERS
+        self.critical_workers = critical_workers or settings.BINGO_DB_CRITICAL_WORKERS
+        self.max_pending = max_pending or settings.BINGO_DB_MAX_PENDING
+        self._pools = {}
+        # Calls submitted but not finished, per pool (only touched on the event loop)
+        self.pending = {CRITICAL: 0, NORMAL: 0}
+
+    def pool_name(self, priority):
+        return CRITICAL if priority == CRITICAL else NORMAL
+
+    def pool(self, name):
+        pool = self._pools.get(name)
+        if pool is None:
+            size = self.critical_workers if name == CRITICAL else self.workers
+            pool = self._pools[name] = ThreadPoolExecutor(size, thread_name_prefix=f'bingo-db-{name}')
+        return pool
+
+    @property
+    def saturated(self):
+        """True when the general pool has more work queued than it should take on"""
+        return self.pending[NORMAL] >= self.max_pending
+
+    def admit(self, priority):
+        """Reserve a slot for a call, or raise DatabaseBusy for low-priority work when saturated"""
+        if priority == LOW and self.saturated:
+            REJECTED.inc()
+            raise DatabaseBusy()
+        name = self.pool_name(priority)
+        self.pending[name] += 1
+        return name
+
+    def release(self, name):
+        self.pending[name] -= 1
+
+
+db_executor = DatabaseExecutor()
+
+metrics.register(metrics.Gauge(
+    'bingo_db_pending', 'Database calls queued or running, per pool',
+    lambda: db_executor.pending, label='pool',
+))
+
+
+def db_sync_to_async(func=None, *, priority=NORMAL):
+    """
+    database_sync_to_async on the game's DB pools. Records, per helper, how
+    long the call waited for a worker thread and how long it ran there.
+    Usable bare (@db_sync_to_async) or with a priority.
+    """
+    if func is None:
+        return functools.partial(db_sync_to_async, priority=priority)
+    label = func.__name__
+
+    def timed(enqueued_at, *args, **kwargs):
+        started = time.perf_counter()
+        metrics.DB_WAIT_SECONDS.observe(started - enqueued_at, helper=label)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.DB_RUN_SECONDS.observe(time.perf_counter() - started, helper=label)
+
+    runner = None
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        nonlocal runner
+        name = db_executor.admit(priority)
+        try:
+            if runner is None:
+                runner = database_sync_to_async(timed, thread_sensitive=False, executor=db_executor.pool(name))
+            return await runner(time.perf_counter(), *args, **kwargs)
+        finally:
+            db_executor.release(name)
+
+    return wrapper
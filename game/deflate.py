@@ -0,0 +1,111 @@
+"""
+permessage-deflate for the Daphne server.
+
+Daphne builds its WebSocket factory without compression, so `manage.py
+serve` runs Daphne with DeflateServer, which sets the factory up to accept
+a client's permessage-deflate offer (browsers always send one) with the
+configured window size and memory level. Only messages of at least
+BINGO_WS_DEFLATE_MIN_SIZE bytes are compressed: turn messages and binary
+frames are a few dozen bytes, deflate saves nothing on them and costs a
+compressor pass on every send, while snapshots and rosters shrink several
+times over.
+
+Each socket's bytes before and after compression are counted as they are
+sent, and its overall compression ratio is observed when it closes.
+"""
+import logging
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from daphne.cli import CommandLineInterface
+from daphne.server import Server
+from daphne.ws_protocol import WebSocketProtocol
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+MESSAGES = metrics.register(metrics.Counter(
+    'bingo_ws_deflate_messages_total', 'Messages sent on deflate sockets, by whether they were compressed',
+))
+WIRE_BYTES = metrics.register(metrics.Counter(
+    'bingo_ws_deflate_bytes_total', 'Bytes sent on deflate sockets, before (payload) and after (wire) compression',
+))
+CONNECTIONS = metrics.register(metrics.Counter(
+    'bingo_ws_connections_closed_total', 'Closed sockets, by whether they negotiated permessage-deflate',
+))
+RATIO = metrics.register(metrics.Histogram(
+    'bingo_ws_compression_ratio', 'Per-socket compressed/uncompressed size of everything it was sent', RATIO_BUCKETS,
+))
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """Daphne's protocol, compressing only payloads of at least `min_size` bytes"""
+
+    min_size = 0
+
+    def serverSend(self, content, binary=False):
+        if self._perMessageCompress is None:
+            return super().serverSend(content, binary)
+        if self.state == self.STATE_CONNECTING:
+            self.serverAccept()
+        payload = content if binary else content.encode('utf8')
+        compress = len(payload) >= self.min_size
+        stats = self.trafficStats
+        before = stats.outgoingOctetsWebSocketLevel
+        self.sendMessage(payload, binary, doNotCompress=not compress)
+        MESSAGES.inc(compressed='yes' if compress else 'no')
+        WIRE_BYTES.inc(len(payload), stage='payload')
+        WIRE_BYTES.inc(stats.outgoingOctetsWebSocketLevel - before, stage='wire')
+
+    def onClose(self, wasClean, code, reason):
+        super().onClose(wasClean, code, reason)
+        stats = self.trafficStats
+        if self._perMessageCompress is None:
+            CONNECTIONS.inc(deflate='no')
+            return
+        CONNECTIONS.inc(deflate='yes')
+        if stats.outgoingOctetsAppLevel:
+            RATIO.observe(stats.outgoingOctetsWebSocketLevel / stats.outgoingOctetsAppLevel)
+
+
+def accept_offer(offers):
+    """Accept the client's first permessage-deflate offer with our window and memory settings"""
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            window_bits = settings.BINGO_WS_DEFLATE_WINDOW_BITS
+            return PerMessageDeflateOfferAccept(
+                offer,
+                # Ask the client to match our window when it lets us choose
+                request_max_window_bits=window_bits if offer.accept_max_window_bits else 0,
+                window_bits=window_bits,
+                mem_level=settings.BINGO_WS_DEFLATE_MEM_LEVEL,
+            )
+    return None
+
+
+class DeflateServer(Server):
+    """Daphne server whose WebSocket factory negotiates permessage-deflate"""
+
+    _ws_factory = None
+
+    @property
+    def ws_factory(self):
+        return self._ws_factory
+
+    @ws_factory.setter
+    def ws_factory(self, factory):
+        # Server.run() creates the factory itself; configure it as it is assigned
+        if factory is not None and settings.BINGO_WS_DEFLATE:
+            DeflateWebSocketProtocol.min_size = settings.BINGO_WS_DEFLATE_MIN_SIZE
+            factory.protocol = DeflateWebSocketProtocol
+            factory.setProtocolOptions(perMessageCompressionAccept=accept_offer)
+            logger.info(
+                f"permessage-deflate on for messages of {settings.BINGO_WS_DEFLATE_MIN_SIZE}+ bytes "
+                f"(window {settings.BINGO_WS_DEFLATE_WINDOW_BITS} bits, mem level {settings.BINGO_WS_DEFLATE_MEM_LEVEL})"
+            )
+        self._ws_factory = factory
+
+
+class DeflateCommandLineInterface(CommandLineInterface):
+    server_class = DeflateServer
@@ -0,0 +1,112 @@
+"""
+Bitmask scoring for Indian Bingo boards.
+
+A board's marked cells are a 25-bit integer (bit i set when cell i is
+marked). Each of the 12 lines (5 rows, 5 columns, 2 diagonals) is a
+precomputed mask, so "is this line complete" is a single AND.
+"""
+
+BOARD_SIZE = 5
+CELL_COUNT = BOARD_SIZE * BOARD_SIZE
+FULL_MASK = (1 << CELL_COUNT) - 1
+WINNING_LINES = 5
+
+# Outcomes of a draw attempt
+DRAW_OK = 'ok'
+DRAW_NOT_YOUR_TURN = 'not_your_turn'
+DRAW_ALREADY_CALLED = 'already_called'
+DRAW_INVALID = 'invalid'
+DRAW_CONFLICT = 'conflict'
+
+
+def positions_mask(positions):
+    """Mask with the bits for the given cell indices set"""
+    mask = 0
+    for idx in positions:
+        mask |= 1 << idx
+    return mask
+
+
+ROW_MASKS = tuple(positions_mask(range(row * 5, row * 5 + 5)) for row in range(BOARD_SIZE))
+COLUMN_MASKS = tuple(positions_mask(range(col, CELL_COUNT, 5)) for col in range(BOARD_SIZE))
+DIAGONAL_MASKS = (
+    positions_mask((0, 6, 12, 18, 24)),  # Top-left to bottom-right
+    positions_mask((4, 8, 12, 16, 20)),  # Top-right to bottom-left
+)
+LINE_MASKS = ROW_MASKS + COLUMN_MASKS + DIAGONAL_MASKS
+
+# For every cell, the line masks passing through it (2 to 4 of them)
+LINES_THROUGH_CELL = tuple(
+    tuple(line for line in LINE_MASKS if line >> idx & 1)
+    for idx in range(CELL_COUNT)
+)
+
+
+def count_lines(mask):
+    """Number of complete lines in a marked-cells mask"""
+    return sum(1 for line in LINE_MASKS if mask & line == line)
+
+
+def is_full_board(board):
+    """True if the board holds 25 numbers, all filled in"""
+    return len(board) == CELL_COUNT and all(n > 0 for n in board)
+
+
+def cell_table(board):
+    """
+    Number -> cell index table for a board, as a list indexed by number.
+    Entries are None for numbers that are not on the board.
+    """
+    table = [None] * (CELL_COUNT + 1)
+    for idx, number in enumerate(board):
+        if 0 < number <= CELL_COUNT:
+            table[number] = idx
+    return table
+
+
+def marked_mask(board, drawn_mask):
+    """Marked-cells mask of a board given the 25-bit drawn-numbers mask"""
+    mask = 0
+    for idx, number in enumerate(board):
+        if 0 < number <= CELL_COUNT and drawn_mask >> (number - 1) & 1:
+            mask |= 1 << idx
+    return mask
+
+
+class Scorecard:
+    """Incrementally scored board: marking a number is O(1)"""
+
+    __slots__ = ('cells', 'marked', 'lines')
+
+    def __init__(self, board, drawn_mask=0):
+        self.cells = cell_table(board)
+        self.marked = marked_mask(board, drawn_mask)
+        self.lines = count_lines(self.marked)
+
+    def mark(self, number):
+        """Mark a called number and return the updated line count"""
+        idx = self.cells[number]
+        if idx is None or self.marked >> idx & 1:
+            return self.lines
+        self.marked |= 1 << idx
+        for line in LINES_THROUGH_CELL[idx]:
+            if self.marked & line == line:
+                self.lines += 1
+        return self.lines
+
+    @property
+    def has_bingo(self):
+        return self.lines >= WINNING_LINES
+
+
+def score_draw(cards, number):
+    """
+    Mark `number` on every scorecard in a room.
+    `cards` maps a key (e.g. player name) to a Scorecard; returns key -> line count.
+    """
+    return {key: card.mark(number) for key, card in cards.items()}
+
+
+def winners(cards):
+    """Keys of the scorecards that have reached the winning line count"""
+    return [key for key, card in cards.items() if card.has_bingo]
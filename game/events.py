@@ -0,0 +1,152 @@
+"""
+Append-only event log per room.
+
+Every change to a live room (a player joining or leaving, a board fill,
+ready, start, a draw, a bingo claim, the win) is appended to the room's
+file, BINGO_EVENT_LOG_DIR/<code>.log, one JSON array per line:
+[kind, unix time in ms, *args]. Each file opens with a snapshot of the room
+as it was loaded, and another snapshot follows every
+BINGO_EVENT_SNAPSHOT_EVERY events, so a restarted worker rebuilds a room
+from its last snapshot plus a short tail (state.recover_room_state), and
+`manage.py replay_games` can re-run whole games.
+
+Lines are buffered and appended in one thread hop per flush, like the
+write-behind queue does for database rows.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from django.conf import settings
+from . import metrics, wire
+from .background import BackgroundLoop
+
+logger = logging.getLogger(__name__)
+
+# Event kinds and their args
+SNAPSHOT = 'snap'   # RoomState.to_record()
+JOIN = 'join'       # name, is_host, player_id
+LEAVE = 'leave'     # name
+FILL = 'fill'       # name, board
+READY = 'ready'     # name
+START = 'start'     # current_turn_player
+DRAW = 'draw'       # number, selected_by, current_turn_player, version
+CLAIM = 'claim'     # name, complete_lines
+WIN = 'win'         # name
+
+EVENTS_LOGGED = metrics.register(metrics.Counter('bingo_events_logged_total', 'Room events appended to the event log'))
+
+
+class EventLog(BackgroundLoop):
+    def __init__(self, directory=None, interval=None, snapshot_every=None):
+        super().__init__()
+        self.directory = settings.BINGO_EVENT_LOG_DIR if directory is None else directory
+        self.interval = settings.BINGO_EVENT_LOG_INTERVAL if interval is None else interval
+        self.snapshot_every = snapshot_every or settings.BINGO_EVENT_SNAPSHOT_EVERY
+        self._pending = {}
+        # Events logged per room since its last snapshot
+        self._since_snapshot = {}
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path(self, code):
+        return os.path.join(self.directory, f'{code}.log')
+
+    def open(self, state):
+        """Start a room's log in this process with a snapshot of its state"""
+        if self.enabled:
+            self._append(state.code, SNAPSHOT, state.to_record())
+            self._since_snapshot[state.code] = 0
+
+    def record(self, state, kind, *args):
+        """Log an event that has just been applied to `state`"""
+        if not self.enabled:
+            return
+        self._append(state.code, kind, *args)
+        EVENTS_LOGGED.inc(kind=kind)
+        count = self._since_snapshot.get(state.code, 0) + 1
+        if count >= self.snapshot_every:
+            self.open(state)
+        else:
+            self._since_snapshot[state.code] = count
+
+    def _append(self, code, kind, *args):
+        line = wire.dumps([kind, int(time.time() * 1000), *args])
+        self._pending.setdefault(code, []).append(line)
+        self.wake()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error writing event log: {str(e)}")
+
+    async def flush(self):
+        """Append every buffered line to its room's file"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+
+    def _write(self, batch):
+        os.makedirs(self.directory, exist_ok=True)
+        for code, lines in batch.items():
+            with open(self.path(code), 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+    def drop(self, codes):
+        """Forget deleted rooms: buffered lines and files both go"""
+        if not self.enabled:
+            return
+        for code in codes:
+            self._pending.pop(code, None)
+            self._since_snapshot.pop(code, None)
+            try:
+                os.remove(self.path(code))
+            except FileNotFoundError:
+                pass
+
+    def read(self, code):
+        """A room's events in order, or [] when it has no log"""
+        try:
+            with open(self.path(code), encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.endswith('\n')]
+        except FileNotFoundError:
+            return []
+
+    def codes(self):
+        """Rooms that have a log file"""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.log'))
+
+    def purge(self, before):
+        """Delete logs not written to since the unix time `before`; returns how many"""
+        removed = 0
+        for code in self.codes():
+            path = self.path(code)
+            try:
+                if os.path.getmtime(path) < before:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def tail(events):
+    """The latest snapshot record and the events logged after it, or (None, [])"""
+    for index in range(len(events) - 1, -1, -1):
+        if events[index][0] == SNAPSHOT:
+            return events[index][2], events[index + 1:]
+    return None, []
+
+
+event_log = EventLog()
@@ -0,0 +1,131 @@
+"""
+Purge of stale rooms and sessions.
+
+Rooms whose players vanished without a clean disconnect, rooms nobody ever
+joined, and expired sessions are deleted in small primary-key chunks, each
+in its own short transaction. Candidates are found through indexed columns
+(Room.last_activity, Room.created_at, Session.expire_date), so a purge
+never scans or locks a whole table. Players and draws go with their room.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+from . import metrics
+from .background import BackgroundLoop
+from .cache import room_cache
+from .codes import allocator
+from .db import LOW, DatabaseBusy, db_sync_to_async
+from .events import event_log
+from .models import Room
+from .state import live_room_codes
+
+logger = logging.getLogger(__name__)
+
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+PURGED = metrics.register(metrics.Counter('bingo_purged_total', 'Stale rows deleted by the purge'))
+
+
+def stale_rooms(now):
+    """Querysets of rooms to purge: idle too long, and never joined"""
+    idle_cutoff = now - timedelta(seconds=settings.BINGO_ROOM_IDLE_TTL)
+    unused_cutoff = now - timedelta(seconds=settings.BINGO_ROOM_UNUSED_TTL)
+    return (
+        Room.objects.filter(last_activity__lt=idle_cutoff).order_by('last_activity'),
+        Room.objects.filter(created_at__lt=unused_cutoff, players__isnull=True).order_by('created_at'),
+    )
+
+
+def delete_in_chunks(queryset, chunk, on_chunk=None, fields=()):
+    """
+    Delete the rows of `queryset` `chunk` primary keys at a time, each chunk
+    in its own transaction. `on_chunk` gets the deleted rows as (pk, *fields)
+    tuples. Returns the number of rows deleted.
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        rows = list(queryset.values_list('pk', *fields)[:chunk])
+        if not rows:
+            return deleted
+        with transaction.atomic():
+            model.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        if on_chunk is not None:
+            on_chunk(rows)
+        deleted += len(rows)
+        if len(rows) < chunk:
+            return deleted
+
+
+def _forget_rooms(rows):
+    for _, code in rows:
+        room_cache.invalidate(code)
+    allocator.release(code for _, code in rows)
+    event_log.drop([code for _, code in rows])
+
+
+def purge_expired(now=None, chunk=None, dry_run=False, exclude=()):
+    """
+    Delete stale rooms (with their players, draws and event logs) and
+    expired sessions. Rooms in `exclude` are kept. Returns counts per kind; with dry_run,
+    nothing is deleted and the counts are what would be.
+    """
+    now = now or timezone.now()
+    chunk = chunk or settings.BINGO_PURGE_CHUNK
+    counts = {'rooms': 0, 'sessions': 0, 'logs': 0}
+
+    for rooms in stale_rooms(now):
+        rooms = rooms.exclude(code__in=exclude)
+        if dry_run:
+            counts['rooms'] += rooms.count()
+            continue
+        counts['rooms'] += delete_in_chunks(rooms, chunk, _forget_rooms, fields=('code',))
+
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        sessions = Session.objects.filter(expire_date__lt=now).order_by('expire_date')
+        counts['sessions'] = sessions.count() if dry_run else delete_in_chunks(sessions, chunk)
+
+    if not dry_run:
+        # Event logs of rooms deleted without dropping them (e.g. by another process)
+        counts['logs'] = event_log.purge((now - timedelta(seconds=settings.BINGO_ROOM_IDLE_TTL)).timestamp())
+        for kind, count in counts.items():
+            PURGED.inc(count, kind=kind)
+    return counts
+
+
+class PeriodicPurge(BackgroundLoop):
+    """Runs purge_expired every `interval` seconds in the background of a worker"""
+
+    def __init__(self, interval=None):
+        super().__init__()
+        self.interval = settings.BINGO_PURGE_INTERVAL if interval is None else interval
+
+    def ensure_running(self):
+        if self.interval > 0:
+            super().ensure_running()
+
+    async def run(self):
+        purge = db_sync_to_async(purge_expired, priority=LOW)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Rooms live in this process are in use whatever their timestamps say
+                counts = await purge(exclude=live_room_codes())
+            except DatabaseBusy:
+                logger.info("Skipping stale data purge: database pool is busy")
+                continue
+            except Exception as e:
+                logger.error(f"Error purging stale data: {str(e)}")
+                continue
+            if any(counts.values()):
+                logger.info(f"Purged {counts['rooms']} stale room(s) and {counts['sessions']} expired session(s)")
+
+
+periodic_purge = PeriodicPurge()
@@ -0,0 +1,226 @@
+"""
+Hierarchical fan-out for large rooms.
+
+A room's first BINGO_FANOUT_GROUP_SIZE player sockets in a process join the
+room group directly, as in a small room. Past that, sockets are put into
+sub-groups of at most that size, and the process adds a single relay
+channel to the room group instead: the relay receives each room message
+once and re-sends it to its sub-groups from a background task. A sender's
+group_send therefore reaches at most BINGO_FANOUT_GROUP_SIZE sockets plus
+one relay per process, however large the audience.
+
+Spectators (read-only sockets) always sit behind the relay, in sub-groups
+of their own, and get a rate-limited feed: messages are collected for
+BINGO_SPECTATOR_FEED_INTERVAL seconds and delivered as one `batch` frame.
+The relay also keeps the room's encoded spectator snapshot, dropped on
+every room message, so it is encoded once per event however many watchers
+connect. The snapshot comes from the room's live state when a player socket
+in this process holds it, and is otherwise read from the database without
+installing live state, so watchers alone never keep a room in memory.
+"""
+import asyncio
+import logging
+import uuid
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import background, metrics, wire
+from .db import db_sync_to_async
+from .state import group_name, peek_room_state, recover_or_load_room_state
+
+logger = logging.getLogger(__name__)
+
+RELAYED = metrics.register(metrics.Counter(
+    'bingo_fanout_relayed_total', 'Room messages re-sent by relays, per tier',
+))
+
+
+class SubGroups:
+    """Sub-groups of one tier (players or spectators), filled up to `size` members each"""
+
+    __slots__ = ('prefix', 'size', 'counts')
+
+    def __init__(self, prefix, size):
+        self.prefix = prefix
+        self.size = size
+        self.counts = []
+
+    def add(self):
+        """Index of the sub-group a new member goes to"""
+        for index, count in enumerate(self.counts):
+            if count < self.size:
+                self.counts[index] += 1
+                return index
+        self.counts.append(1)
+        return len(self.counts) - 1
+
+    def remove(self, index):
+        self.counts[index] -= 1
+
+    def name(self, index):
+        return f'{self.prefix}.{index}'
+
+    def names(self):
+        return [self.name(index) for index, count in enumerate(self.counts) if count]
+
+    @property
+    def members(self):
+        return sum(self.counts)
+
+
+class RoomRelay:
+    """This process's relay for one room: a channel in the room group feeding local sub-groups"""
+
+    def __init__(self, code, channel, token, size):
+        self.code = code
+        self.channel = channel
+        root = group_name(code)
+        self.players = SubGroups(f'{root}.{token}.p', size)
+        self.spectators = SubGroups(f'{root}.{token}.s', size)
+        self.feed = []
+        self.snapshot = None
+        # Room messages relayed so far; a snapshot read across one is not cached
+        self.generation = 0
+        self.task = None
+        self.feed_task = None
+
+    @property
+    def members(self):
+        return self.players.members + self.spectators.members
+
+
+class Fanout:
+    def __init__(self, group_size=None, feed_interval=None):
+        self.group_size = settings.BINGO_FANOUT_GROUP_SIZE if group_size is None else group_size
+        self.feed_interval = settings.BINGO_SPECTATOR_FEED_INTERVAL if feed_interval is None else feed_interval
+        # Sub-group names carry a per-process token so relays of different workers never overlap
+        self.token = uuid.uuid4().hex[:8]
+        self._direct = {}
+        self._relays = {}
+        self._locks = {}
+
+    async def join(self, code, channel_name, spectator=False):
+        """
+        Add a socket to the room's fan-out; returns the membership to pass
+        to leave(). Player sockets join the room group directly while there
+        is room for them, so small rooms never go through a relay.
+        """
+        layer = get_channel_layer()
+        direct = self._direct.get(code, 0)
+        if not spectator and direct < self.group_size:
+            self._direct[code] = direct + 1
+            group = group_name(code)
+            await layer.group_add(group, channel_name)
+            return (group, None, None)
+
+        relay = await self._relay(code)
+        tier = relay.spectators if spectator else relay.players
+        index = tier.add()
+        group = tier.name(index)
+        await layer.group_add(group, channel_name)
+        return (group, tier, index)
+
+    async def leave(self, code, channel_name, membership):
+        group, tier, index = membership
+        layer = get_channel_layer()
+        await layer.group_discard(group, channel_name)
+        if tier is None:
+            remaining = self._direct.get(code, 0) - 1
+            if remaining > 0:
+                self._direct[code] = remaining
+            else:
+                self._direct.pop(code, None)
+            return
+        tier.remove(index)
+        relay = self._relays.get(code)
+        if relay is not None and not relay.members:
+            await self._close(relay)
+
+    async def snapshot(self, code):
+        """The room's spectator_init frame, encoded at most once per room event; None if the room is gone"""
+        relay = self._relays.get(code)
+        if relay is not None and relay.snapshot is not None:
+            return relay.snapshot
+        generation = relay.generation if relay is not None else None
+        state = peek_room_state(code)
+        if state is None:
+            state = await db_sync_to_async(recover_or_load_room_state)(code)
+            if state is None:
+                return None
+        text = wire.dumps({
+            'type': 'spectator_init',
+            'room_code': code,
+            'room_data': state.snapshot(),
+            'winner': state.winner,
+        })
+        if relay is not None and relay.generation == generation:
+            relay.snapshot = text
+        return text
+
+    @property
+    def relay_count(self):
+        return len(self._relays)
+
+    async def _relay(self, code):
+        relay = self._relays.get(code)
+        if relay is not None:
+            return relay
+
+        lock = self._locks.setdefault(code, asyncio.Lock())
+        async with lock:
+            relay = self._relays.get(code)
+            if relay is None:
+                layer = get_channel_layer()
+                relay = RoomRelay(code, await layer.new_channel('bingo.relay.'), self.token, self.group_size)
+                await layer.group_add(group_name(code), relay.channel)
+                relay.task = background.create_task(self._run(relay))
+                self._relays[code] = relay
+                logger.debug(f"Started relay for room {code}")
+        self._locks.pop(code, None)
+        return relay
+
+    async def _close(self, relay):
+        self._relays.pop(relay.code, None)
+        for task in (relay.task, relay.feed_task):
+            if task is not None:
+                task.cancel()
+        await get_channel_layer().group_discard(group_name(relay.code), relay.channel)
+        logger.debug(f"Stopped relay for room {relay.code}")
+
+    async def _run(self, relay):
+        layer = get_channel_layer()
+        while True:
+            message = await layer.receive(relay.channel)
+            relay.snapshot = None
+            relay.generation += 1
+            try:
+                for group in relay.players.names():
+                    await layer.group_send(group, message)
+                    # Let sockets and other rooms run between sub-groups
+                    await asyncio.sleep(0)
+                RELAYED.inc(tier='players')
+                if relay.spectators.members and 'text' in message:
+                    relay.feed.append(message['text'])
+                    if relay.feed_task is None or relay.feed_task.done():
+                        relay.feed_task = background.create_task(self._feed(relay))
+            except Exception as e:
+                logger.error(f"Error relaying to room {relay.code}: {str(e)}")
+
+    async def _feed(self, relay):
+        """Deliver the spectators' messages collected over one feed interval as one batch"""
+        await asyncio.sleep(self.feed_interval)
+        texts, relay.feed = relay.feed, []
+        if not texts:
+            return
+        layer = get_channel_layer()
+        message = {'type': 'spectator_feed', 'text': '{"type":"batch","messages":[' + ','.join(texts) + ']}'}
+        for group in relay.spectators.names():
+            await layer.group_send(group, message)
+            await asyncio.sleep(0)
+        RELAYED.inc(tier='spectators')
+
+
+fanout = Fanout()
+
+metrics.register(metrics.Gauge(
+    'bingo_fanout_relays', 'Rooms whose sockets this process reaches through a relay', lambda: fanout.relay_count,
+))
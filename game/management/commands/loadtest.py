@@ -0,0 +1,327 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.sessions import SessionMiddlewareStack
+from channels.testing import WebsocketCommunicator
+from game import engine, wire
+from game.events import event_log
+from game.tickets import issue_ticket
+import game.routing
+
+
+class QueryCounter:
+    """Counts ORM queries on every database connection, including executor threads"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        connection.execute_wrappers.append(self)
+        connection_created.connect(self._on_connection_created)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.messages = 0
+        self.bytes = 0
+        self.queries = {}
+
+    def record(self, action, seconds):
+        self.latencies.setdefault(action, []).append(seconds)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class SimPlayer:
+    """One simulated browser: a WebSocket plus a reader task that resolves waiters"""
+
+    def __init__(self, application, room_code, name, session_key, is_host, stats, timeout, binary=False):
+        self.name = name
+        self.stats = stats
+        self.timeout = timeout
+        self.board = []
+        self.drawn = set()
+        self.turn = ''
+        self.winner = None
+        self.slot_names = {}
+        self.communicator = WebsocketCommunicator(
+            # Like the room page: the cookie rides along, the ticket identifies
+            application, f'/ws/game/{room_code}/?ticket={issue_ticket(name, room_code, is_host)}',
+            headers=[(b'cookie', f'sessionid={session_key}'.encode())],
+            subprotocols=[wire.BINARY_SUBPROTOCOL] if binary else None,
+        )
+        self._waiters = []
+        self._reader = None
+
+    async def connect(self):
+        started = time.perf_counter()
+        waiter = self.expect('game_init')
+        connected, _ = await self.communicator.connect(timeout=self.timeout)
+        if not connected:
+            raise RuntimeError(f"{self.name} could not connect")
+        self._reader = asyncio.create_task(self._read())
+        await waiter
+        self.stats.record('connect', time.perf_counter() - started)
+
+    async def disconnect(self):
+        await self.communicator.disconnect()
+        if self._reader is not None:
+            self._reader.cancel()
+
+    def expect(self, message_type, predicate=None):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((message_type, predicate, future))
+        return future
+
+    async def request(self, action, message_type, predicate=None, **payload):
+        """Send an action and time it until the expected reply arrives"""
+        waiter = self.expect(message_type, predicate)
+        started = time.perf_counter()
+        await self.communicator.send_to(text_data=json.dumps({'action': action, **payload}))
+        message = await asyncio.wait_for(waiter, self.timeout)
+        self.stats.record(action, time.perf_counter() - started)
+        return message
+
+    async def _read(self):
+        while True:
+            output = await self.communicator.receive_output(timeout=self.timeout)
+            if output['type'] == 'websocket.close':
+                return
+            text = output.get('text')
+            data = output.get('bytes')
+            if text is not None:
+                self.stats.bytes += len(text)
+                message = json.loads(text)
+            elif data is not None:
+                self.stats.bytes += len(data)
+                message = wire.decode_frame(data, self.slot_names)
+            else:
+                continue
+            self.stats.messages += 1
+            self._track(message)
+            for waiter in list(self._waiters):
+                message_type, predicate, future = waiter
+                if message['type'] == message_type and (predicate is None or predicate(message)):
+                    self._waiters.remove(waiter)
+                    if not future.done():
+                        future.set_result(message)
+
+    def _track(self, message):
+        if message['type'] == 'game_init':
+            self.drawn = set(message['room_data'].get('drawn_numbers', []))
+            self.turn = message['room_data'].get('current_turn_player', '')
+            self.slot_names.update((p['slot'], p['name']) for p in message['room_data']['players'])
+        elif message['type'] == 'roster_update':
+            self.slot_names.update((p['slot'], p['name']) for p in message['players'])
+        elif message['type'] == 'game_started':
+            self.turn = message['current_turn_player']
+        elif message['type'] == 'number_called':
+            self.drawn.add(message['number'])
+            self.turn = message['current_turn_player']
+        elif message['type'] == 'bingo_winner':
+            self.winner = message['winner']
+
+    @property
+    def lines(self):
+        return engine.count_lines(engine.marked_mask(self.board, sum(1 << (n - 1) for n in self.drawn)))
+
+
+class SimRoom:
+    """A room and its players, driven through a full game"""
+
+    def __init__(self, index, players, auto_winner, stats, timeout, binary=False):
+        self.index = index
+        self.names = [f'r{index}p{n}' for n in range(players)]
+        self.auto_winner = auto_winner
+        self.binary = binary
+        self.stats = stats
+        self.timeout = timeout
+        self.code = None
+        self.players = []
+        self.moves = 0
+
+    def open(self, application):
+        """Create the room and join everyone through the HTTP views (sync)"""
+        host_name, *guests = self.names
+        sessions = []
+
+        client = Client()
+        data = {'name': host_name}
+        if self.auto_winner:
+            data['auto_detect_winner'] = 'on'
+        response = client.post('/create/', data)
+        self.code = response['Location'].rstrip('/').split('/')[-1]
+        sessions.append(client.cookies['sessionid'].value)
+
+        for name in guests:
+            client = Client()
+            response = client.post('/join/', {'name': name, 'room_code': self.code})
+            if response.status_code != 302:
+                raise RuntimeError(f"{name} could not join {self.code}")
+            sessions.append(client.cookies['sessionid'].value)
+
+        self.players = [
+            SimPlayer(application, self.code, name, session_key, n == 0, self.stats, self.timeout, self.binary)
+            for n, (name, session_key) in enumerate(zip(self.names, sessions))
+        ]
+
+    async def connect(self):
+        await asyncio.gather(*(player.connect() for player in self.players))
+
+    async def fill(self):
+        for player in self.players:
+            message = await player.request('generate_random_board', 'board_generated')
+            player.board = message['board']
+
+    async def ready(self):
+        for player in self.players:
+            await player.request(
+                'player_ready', 'roster_update',
+                predicate=lambda m, name=player.name: name in m['ready'],
+            )
+
+    async def start(self):
+        await self.players[0].request('start_game', 'game_started')
+
+    async def play(self):
+        by_name = {player.name: player for player in self.players}
+        host = self.players[0]
+        while host.winner is None:
+            player = by_name[host.turn]
+            number = next(n for n in player.board if n not in player.drawn)
+            seq = len(host.drawn) + 1
+            is_draw = lambda m, seq=seq: m['seq'] == seq
+            winner = host.expect('bingo_winner')
+            # Everyone must see the draw before the next turn is taken
+            seen = [p.expect('number_called', is_draw) for p in self.players if p is not player]
+            await player.request('select_number', 'number_called', predicate=is_draw, number=number)
+            await asyncio.wait_for(asyncio.gather(*seen), self.timeout)
+            self.moves += 1
+
+            leaders = [p for p in self.players if p.lines >= engine.WINNING_LINES]
+            if not leaders:
+                winner.cancel()
+                continue
+            if not self.auto_winner:
+                claimant = player if player in leaders else leaders[0]
+                await claimant.request(
+                    'claim_bingo', 'bingo_winner',
+                    board_state=[{'number': n, 'marked': n in claimant.drawn} for n in claimant.board],
+                )
+            await asyncio.wait_for(winner, self.timeout)
+
+    async def close(self):
+        await asyncio.gather(*(player.disconnect() for player in self.players))
+
+
+class Command(BaseCommand):
+    help = 'Simulate concurrent WebSocket players driving full games and report per-action latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Number of concurrent rooms')
+        parser.add_argument('--players', type=int, default=4, help='Players per room')
+        parser.add_argument('--auto-winner', action='store_true', help='Use rooms with automatic winner detection')
+        parser.add_argument('--binary', action='store_true', help='Negotiate the binary protocol for game events')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for any single reply')
+        parser.add_argument('--use-configured-db', action='store_true',
+                            help='Run against the configured database instead of a throwaway test database')
+        parser.add_argument('--event-log', default=None,
+                            help='Keep the rooms\' event logs in this directory (for replay_games)')
+
+    def handle(self, *args, **options):
+        # Per-connection logging would dominate the run
+        logging.getLogger('game').setLevel(logging.WARNING)
+
+        setup_test_environment()
+        old_name = None
+        if not options['use_configured_db']:
+            old_name = connection.settings_dict['NAME']
+            if connection.vendor == 'sqlite':
+                # An in-memory database only has table locks, which fail instead of
+                # waiting when several DB pool threads write at once
+                test_name = os.path.join(tempfile.gettempdir(), 'bingo_loadtest.sqlite3')
+                connection.settings_dict['TEST']['NAME'] = test_name
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Simulated rooms never log next to real ones
+        event_log.directory = options['event_log'] or tempfile.mkdtemp(prefix='bingo_events_')
+        try:
+            stats = asyncio.run(self.run(options))
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            if not options['event_log']:
+                shutil.rmtree(event_log.directory, ignore_errors=True)
+            teardown_test_environment()
+        self.report(stats, options)
+
+    async def run(self, options):
+        application = SessionMiddlewareStack(URLRouter(game.routing.websocket_urlpatterns))
+        stats = Stats()
+        counter = QueryCounter()
+        counter.install()
+
+        rooms = [SimRoom(i, options['players'], options['auto_winner'], stats, options['timeout'], options['binary'])
+                 for i in range(options['rooms'])]
+
+        started = time.perf_counter()
+        for phase in ('open', 'connect', 'fill', 'ready', 'start', 'play', 'close'):
+            before = counter.count
+            if phase == 'open':
+                for room in rooms:
+                    await sync_to_async(room.open)(application)
+            else:
+                await asyncio.gather(*(getattr(room, phase)() for room in rooms))
+            stats.queries[phase] = counter.count - before
+            self.stdout.write(f"  {phase:<8} done ({stats.queries[phase]} queries)")
+        stats.elapsed = time.perf_counter() - started
+        stats.moves = sum(room.moves for room in rooms)
+        stats.players = len(rooms) * options['players']
+
+        # Let write-behind flushes settle before the database goes away
+        await asyncio.sleep(0.2)
+        await event_log.flush()
+        return stats
+
+    def report(self, stats, options):
+        self.stdout.write('')
+        self.stdout.write(f"{options['rooms']} rooms x {options['players']} players, "
+                          f"{stats.moves} moves in {stats.elapsed:.2f}s")
+        self.stdout.write(f"{'action':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for action, values in stats.latencies.items():
+            values = sorted(values)
+            self.stdout.write(
+                f"{action:<24}{len(values):>8}"
+                f"{percentile(values, 0.50) * 1000:>10.2f}"
+                f"{percentile(values, 0.95) * 1000:>10.2f}"
+                f"{percentile(values, 0.99) * 1000:>10.2f}"
+                f"{values[-1] * 1000:>10.2f}"
+            )
+        self.stdout.write('')
+        self.stdout.write(f"messages received: {stats.messages} "
+                          f"({stats.messages / stats.elapsed:.0f}/s, {stats.bytes / 1024:.1f} KiB)")
+        moves = max(stats.moves, 1)
+        self.stdout.write(f"DB queries: connect {stats.queries['connect'] / stats.players:.2f}/player, "
+                          f"play {stats.queries['play'] / moves:.2f}/move")
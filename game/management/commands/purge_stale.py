@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from game.expiry import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete idle and never-joined rooms (with their players) and expired sessions, in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=None,
+                            help='Rows deleted per transaction (default: BINGO_PURGE_CHUNK)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        counts = purge_expired(chunk=options['chunk'], dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f"{verb} {counts['rooms']} room(s) and {counts['sessions']} session(s)")
+        if counts['logs']:
+            self.stdout.write(f"Deleted {counts['logs']} orphaned event log(s)")
@@ -0,0 +1,88 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from game import engine
+from game.events import EventLog, event_log, SNAPSHOT, DRAW, CLAIM, WIN
+from game.state import RoomState
+
+
+class Replay:
+    """One room's log re-run through RoomState and the scoring engine"""
+
+    def __init__(self, code, events):
+        self.code = code
+        self.events = events
+        self.draws = sum(1 for event in events if event[0] == DRAW)
+        self.mismatches = []
+
+    def run(self):
+        """Replay from the opening snapshot; every later snapshot, draw, claim and win is checked"""
+        self.mismatches = []
+        state = RoomState.from_record(self.events[0][2])
+        drawn_by = None
+        for event in self.events[1:]:
+            kind, _, *args = event
+            if kind == SNAPSHOT:
+                self.check(state.to_record() == args[0], event)
+            elif kind == DRAW:
+                number, drawn_by, current_turn_player, version = args
+                result = state.apply_draw(number, drawn_by)
+                self.check(result == engine.DRAW_OK and state.current_turn_player == current_turn_player
+                           and state.version == version, event)
+            elif kind == CLAIM:
+                name, lines = args
+                # Claims on boards the server never scored were judged on the submitted board
+                self.check(name not in state.cards or state.lines_for(name) == lines, event)
+            elif kind == WIN:
+                if state.auto_detect_winner:
+                    self.check(state.detect_winner(drawn_by) == args[0], event)
+                state.apply_event(event)
+            else:
+                state.apply_event(event)
+        return state
+
+    def check(self, ok, event):
+        if not ok:
+            self.mismatches.append(event)
+
+
+class Command(BaseCommand):
+    help = 'Re-run logged games through the engine as fast as possible, checking them against their logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('codes', nargs='*', help='Rooms to replay (default: every log)')
+        parser.add_argument('--dir', default=None, help='Event log directory (default: BINGO_EVENT_LOG_DIR)')
+        parser.add_argument('--repeat', type=int, default=1, help='Replay every game this many times')
+
+    def handle(self, *args, **options):
+        log = EventLog(directory=options['dir']) if options['dir'] else event_log
+        if not log.enabled:
+            raise CommandError('No event log directory: set BINGO_EVENT_LOG_DIR or pass --dir')
+
+        replays = []
+        for code in options['codes'] or log.codes():
+            events = log.read(code)
+            if not events or events[0][0] != SNAPSHOT:
+                self.stderr.write(f"Skipping {code}: log does not open with a snapshot")
+                continue
+            replays.append(Replay(code, events))
+        if not replays:
+            raise CommandError(f"No replayable logs in {log.directory}")
+
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+            for replay in replays:
+                replay.run()
+        elapsed = time.perf_counter() - started
+
+        for replay in replays:
+            for event in replay.mismatches:
+                self.stdout.write(f"{replay.code}: replay disagrees with {event}")
+
+        events = sum(len(replay.events) for replay in replays) * options['repeat']
+        draws = sum(replay.draws for replay in replays) * options['repeat']
+        mismatches = sum(len(replay.mismatches) for replay in replays)
+        self.stdout.write(
+            f"Replayed {len(replays)} game(s) x {options['repeat']}: {events} events, {draws} draws "
+            f"in {elapsed * 1000:.1f} ms ({events / elapsed:,.0f} events/s, {draws / elapsed:,.0f} draws/s)"
+        )
+        self.stdout.write(f"{mismatches} mismatch(es)")
@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game import sharding
+
+# Largest request head the router will buffer while looking for the path
+MAX_HEAD = 64 * 1024
+
+
+class ShardRouter:
+    """
+    Minimal TCP router in front of the shard workers. It reads the first
+    request head on each connection, sends game sockets to the shard owning
+    the room and spreads everything else round-robin, then pipes bytes both
+    ways untouched.
+    """
+
+    def __init__(self, backends, stdout):
+        self.backends = backends
+        self.stdout = stdout
+        self._next = itertools.cycle(range(len(backends)))
+
+    def pick(self, head):
+        try:
+            path = head.split(b' ', 2)[1].decode('latin-1').split('?', 1)[0]
+        except IndexError:
+            path = ''
+        shard = sharding.shard_from_path(path, len(self.backends))
+        return shard if shard is not None else next(self._next)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        host, port = self.backends[self.pick(head)]
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            self.stdout.write(f"Shard at {host}:{port} unreachable: {e}")
+            writer.close()
+            return
+        upstream_writer.write(head)
+        await asyncio.gather(self.pipe(reader, upstream_writer), self.pipe(upstream_reader, writer))
+
+    async def pipe(self, reader, writer):
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD)
+        async with server:
+            await server.serve_forever()
+
+
+class Command(BaseCommand):
+    help = 'Run the game as room-sharded Daphne workers behind a local router (one room, one process)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=None,
+                            help='Number of worker processes (default: BINGO_SHARDS, or the CPU count)')
+        parser.add_argument('--bind', default='127.0.0.1', help='Address the router listens on')
+        parser.add_argument('--port', type=int, default=8000, help='Port the router listens on')
+        parser.add_argument('--backend-port', type=int, default=None,
+                            help='First worker port; workers use consecutive ports (default: --port + 1)')
+
+    def handle(self, *args, **options):
+        shards = options['shards'] or (settings.BINGO_SHARDS if settings.BINGO_SHARDS > 1 else os.cpu_count())
+        if shards < 1:
+            raise CommandError('--shards must be at least 1')
+        first_port = options['backend_port'] or options['port'] + 1
+        backends = [('127.0.0.1', first_port + i) for i in range(shards)]
+
+        module, _, attr = settings.ASGI_APPLICATION.rpartition('.')
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        workers = []
+        try:
+            for index, (host, port) in enumerate(backends):
+                env = {**os.environ, 'BINGO_SHARDS': str(shards), 'BINGO_SHARD_INDEX': str(index)}
+                workers.append(subprocess.Popen(
+                    [sys.executable, manage, 'serve', '-b', host, '-p', str(port), f'{module}:{attr}'],
+                    env=env,
+                ))
+                self.stdout.write(f"Shard {index} on {host}:{port} (pid {workers[-1].pid})")
+            self.wait_for(backends, workers)
+            self.stdout.write(f"Routing {options['bind']}:{options['port']} across {shards} shards")
+            asyncio.run(ShardRouter(backends, self.stdout).serve(options['bind'], options['port']))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.wait()
+
+    def wait_for(self, backends, workers, timeout=30):
+        """Block until every worker accepts connections"""
+        deadline = time.monotonic() + timeout
+        for (host, port), worker in zip(backends, workers):
+            while True:
+                if worker.poll() is not None:
+                    raise CommandError(f"Shard on port {port} exited with status {worker.returncode}")
+                try:
+                    socket.create_connection((host, port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise CommandError(f"Shard on port {port} did not start within {timeout}s")
+                    time.sleep(0.1)
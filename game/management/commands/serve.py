@@ -0,0 +1,18 @@
+import argparse
+from django.core.management.base import BaseCommand
+from game.deflate import DeflateCommandLineInterface
+
+
+class Command(BaseCommand):
+    help = 'Run Daphne with permessage-deflate (see BINGO_WS_DEFLATE); arguments are passed to daphne'
+
+    def add_arguments(self, parser):
+        parser.add_argument('daphne_args', nargs=argparse.REMAINDER,
+                            help='Daphne options and application, e.g. -b 0.0.0.0 -p 8000 bingo_project.asgi:application')
+
+    def run_from_argv(self, argv):
+        # Daphne's options (-b, -p, -v ...) clash with Django's, so hand them over unparsed
+        DeflateCommandLineInterface().run(argv[2:])
+
+    def handle(self, *args, **options):
+        DeflateCommandLineInterface().run(options['daphne_args'])
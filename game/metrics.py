@@ -0,0 +1,176 @@
+"""
+In-process instrumentation for the game server.
+
+Metrics are plain counters, gauges and histograms, rendered in the
+Prometheus text exposition format by views.metrics. ORM queries are
+counted per consumer action through a connection execute wrapper; the
+action in progress travels in a ContextVar, which asgiref carries into
+the database_sync_to_async threads.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return lines
+
+
+class Gauge:
+    """
+    A value read from a callback at render time. With `label`, the callback
+    returns a dict mapping that label's values to readings.
+    """
+
+    def __init__(self, name, help_text, callback, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.label = label
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        if self.label is None:
+            lines.append(f'{self.name} {self.callback()}')
+        else:
+            for value, reading in sorted(self.callback().items()):
+                lines.append(f'{self.name}{_format_labels(((self.label, value),))} {reading}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+ACTION_SECONDS = Histogram('bingo_action_seconds', 'Time spent handling a consumer action')
+ACTION_QUERIES = Histogram('bingo_action_queries', 'ORM queries issued per consumer action', QUERY_BUCKETS)
+DB_WAIT_SECONDS = Histogram('bingo_db_wait_seconds', 'Time a database helper waited for a worker thread')
+DB_RUN_SECONDS = Histogram('bingo_db_run_seconds', 'Time a database helper ran in its worker thread')
+QUERIES_TOTAL = Counter('bingo_queries_total', 'ORM queries executed')
+MESSAGES_SENT = Counter('bingo_messages_sent_total', 'WebSocket messages sent to clients')
+BYTES_SENT = Counter('bingo_bytes_sent_total', 'Payload bytes sent to clients')
+
+REGISTRY = [ACTION_SECONDS, ACTION_QUERIES, DB_WAIT_SECONDS, DB_RUN_SECONDS, QUERIES_TOTAL, MESSAGES_SENT, BYTES_SENT]
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    """All metrics in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class _ActionScope:
+    __slots__ = ('queries',)
+
+    def __init__(self):
+        self.queries = 0
+
+
+_current_action = contextvars.ContextVar('bingo_current_action', default=None)
+
+
+@contextmanager
+def track_action(action):
+    """Time an action and count the ORM queries it issues, including those in worker threads"""
+    scope = _ActionScope()
+    token = _current_action.set(scope)
+    started = time.perf_counter()
+    try:
+        yield scope
+    finally:
+        ACTION_SECONDS.observe(time.perf_counter() - started, action=action)
+        ACTION_QUERIES.observe(scope.queries, action=action)
+        _current_action.reset(token)
+
+
+def untracked():
+    """Detach the current context (e.g. a background task) from any action"""
+    _current_action.set(None)
+
+
+def count_query(execute, sql, params, many, context):
+    """Connection execute wrapper attributing each query to the current action"""
+    scope = _current_action.get()
+    if scope is not None:
+        scope.queries += 1
+    QUERIES_TOTAL.inc()
+    return execute(sql, params, many, context)
+
+
+def _install_on_connection(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def install_query_counter():
+    """Count queries on every database connection, current and future"""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_install_on_connection, dispatch_uid='bingo_count_query')
+    for conn in connections.all(initialized_only=True):
+        _install_on_connection(None, conn)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='auto_detect_winner',
+            field=models.BooleanField(default=False),
+        ),
+    ]
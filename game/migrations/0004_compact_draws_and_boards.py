@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:49
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    Room = apps.get_model('game', 'Room')
+    Player = apps.get_model('game', 'Player')
+    Draw = apps.get_model('game', 'Draw')
+
+    draws = []
+    for room in Room.objects.exclude(drawn_numbers='').iterator():
+        numbers = [int(n) for n in room.drawn_numbers.split(',') if n]
+        mask = 0
+        for seq, number in enumerate(numbers, start=1):
+            mask |= 1 << (number - 1)
+            draws.append(Draw(room_id=room.pk, seq=seq, number=number))
+        Room.objects.filter(pk=room.pk).update(drawn_mask=mask)
+    Draw.objects.bulk_create(draws, batch_size=500)
+
+    for player in Player.objects.exclude(board_state='').iterator():
+        board = bytes(json.loads(player.board_state))
+        Player.objects.filter(pk=player.pk).update(board=board)
+
+
+def backwards(apps, schema_editor):
+    Room = apps.get_model('game', 'Room')
+    Player = apps.get_model('game', 'Player')
+
+    for room in Room.objects.exclude(drawn_mask=0).iterator():
+        numbers = room.draws.order_by('seq').values_list('number', flat=True)
+        Room.objects.filter(pk=room.pk).update(drawn_numbers=','.join(map(str, numbers)))
+
+    for player in Player.objects.exclude(board=b'').iterator():
+        Player.objects.filter(pk=player.pk).update(board_state=json.dumps(list(bytes(player.board))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_room_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='player',
+            name='board',
+            field=models.BinaryField(blank=True, default=b'', max_length=25),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='drawn_mask',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Draw',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveSmallIntegerField()),
+                ('number', models.PositiveSmallIntegerField()),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='draws', to='game.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'seq'), name='unique_draw_seq')],
+            },
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='player',
+            name='board_state',
+        ),
+        migrations.RemoveField(
+            model_name='room',
+            name='drawn_numbers',
+        ),
+    ]
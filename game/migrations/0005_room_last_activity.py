@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:15
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def forwards(apps, schema_editor):
+    # Nothing better is known about existing rooms than when they were created
+    Room = apps.get_model('game', 'Room')
+    Room.objects.update(last_activity=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_compact_draws_and_boards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
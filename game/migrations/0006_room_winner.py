@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_room_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='winner',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
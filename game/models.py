@@ -1,17 +1,33 @@
-from django.db import models
+from django.db import models, transaction, connection
+from django.utils import timezone
 import random, string
-import json
+from . import engine
+
+def encode_board(board_numbers):
+    """Pack a board (25 numbers, 0 for an empty cell) into its binary column value"""
+    return bytes(board_numbers)
+
+
+def decode_board(data):
+    if data:
+        return list(bytes(data))
+    return []
+
 
 class Room(models.Model):
     code = models.CharField(max_length=10, unique=True)
     host_name = models.CharField(max_length=50, default="Host")
-    drawn_numbers = models.TextField(default="", blank=True)  # comma-separated numbers
+    drawn_mask = models.IntegerField(default=0)  # bit n-1 set once number n has been drawn
     current_number = models.IntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     game_started = models.BooleanField(default=False)
     players_who_selected_this_round = models.TextField(default="", blank=True)  # comma-separated player names
     current_turn_player = models.CharField(max_length=50, default="", blank=True)  # whose turn it is
-    created_at = models.DateTimeField(auto_now_add=True)
+    auto_detect_winner = models.BooleanField(default=False)  # server announces the winner on every draw
+    version = models.PositiveIntegerField(default=0)  # bumped on every turn advance, used for compare-and-swap
+    winner = models.CharField(max_length=50, default="", blank=True)  # set once a bingo is declared; no draws after it
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)  # bumped by joins, ready and moves
 
     def save(self, *args, **kwargs):
         if not self.code:
@@ -19,46 +35,124 @@ class Room(models.Model):
         super().save(*args, **kwargs)
 
     def get_drawn_numbers_list(self):
-        if self.drawn_numbers:
-            return [int(n) for n in self.drawn_numbers.split(',') if n]
-        return []
+        """Drawn numbers in the order they were called"""
+        if not self.drawn_mask:
+            return []
+        return list(self.draws.order_by('seq').values_list('number', flat=True))
 
     def add_drawn_number(self, number):
-        drawn = self.get_drawn_numbers_list()
-        if number not in drawn:
-            drawn.append(number)
-            self.drawn_numbers = ','.join(map(str, drawn))
+        if not self.drawn_mask >> (number - 1) & 1:
+            seq = bin(self.drawn_mask).count('1') + 1
+            self.drawn_mask |= 1 << (number - 1)
             self.current_number = number
-            self.save()
+            with transaction.atomic():
+                self.save(update_fields=['drawn_mask', 'current_number'])
+                Draw.objects.create(room=self, seq=seq, number=number)
+
+    @classmethod
+    def advance_turn(cls, code, player_name, number):
+        """
+        Atomically record `number` as drawn by `player_name` and pass the turn
+        to the next connected player. Returns (result, room) with result one of
+        the engine.DRAW_* outcomes.
+
+        Uses SELECT ... FOR UPDATE where the database supports it and a
+        compare-and-swap on `version` elsewhere, so concurrent moves from
+        different workers cannot overwrite each other.
+        """
+        if connection.features.has_select_for_update:
+            with transaction.atomic():
+                room = cls.objects.select_for_update().get(code=code)
+                result = room._apply_draw(player_name, number)
+                if result == engine.DRAW_OK:
+                    room.save(update_fields=['drawn_mask', 'current_number', 'current_turn_player', 'version', 'last_activity'])
+                    Draw.objects.create(room=room, seq=room.draw_count, number=number)
+                return result, room
+
+        room = cls.objects.get(code=code)
+        result = room._apply_draw(player_name, number)
+        if result != engine.DRAW_OK:
+            return result, room
+        with transaction.atomic():
+            updated = cls.objects.filter(pk=room.pk, version=room.version - 1).update(
+                drawn_mask=room.drawn_mask,
+                current_number=room.current_number,
+                current_turn_player=room.current_turn_player,
+                version=room.version,
+                last_activity=room.last_activity,
+            )
+            if not updated:
+                return engine.DRAW_CONFLICT, room
+            Draw.objects.create(room=room, seq=room.draw_count, number=number)
+        return engine.DRAW_OK, room
+
+    def _apply_draw(self, player_name, number):
+        if self.winner or not isinstance(number, int) or not 1 <= number <= engine.CELL_COUNT:
+            return engine.DRAW_INVALID
+        if self.current_turn_player != player_name:
+            return engine.DRAW_NOT_YOUR_TURN
+        if self.drawn_mask >> (number - 1) & 1:
+            return engine.DRAW_ALREADY_CALLED
+
+        self.drawn_mask |= 1 << (number - 1)
+        self.current_number = number
+
+        # Rotate to the next connected player in join order
+        connected_players = list(self.players.filter(is_connected=True).order_by('id').values_list('name', flat=True))
+        if connected_players:
+            try:
+                next_index = (connected_players.index(player_name) + 1) % len(connected_players)
+            except ValueError:
+                next_index = 0
+            self.current_turn_player = connected_players[next_index]
+
+        self.version += 1
+        self.last_activity = timezone.now()
+        return engine.DRAW_OK
+
+    @property
+    def draw_count(self):
+        return bin(self.drawn_mask).count('1')
 
     def get_available_numbers(self):
-        drawn = set(self.get_drawn_numbers_list())
-        return [n for n in range(1, 76) if n not in drawn]  # Traditional bingo 1-75
+        return [n for n in range(1, engine.CELL_COUNT + 1) if not self.drawn_mask >> (n - 1) & 1]
 
     def __str__(self):
         return f"Room {self.code} - Host: {self.host_name}"
 
+class Draw(models.Model):
+    """One called number; `seq` is its position in the room's draw order (1-based)"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='draws')
+    seq = models.PositiveSmallIntegerField()
+    number = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"#{self.seq}: {self.number} in {self.room.code}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'seq'], name='unique_draw_seq'),
+        ]
+
 class Player(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='players')
     name = models.CharField(max_length=50)
     channel_name = models.CharField(max_length=255, blank=True)
-    board_state = models.TextField(default="")  # JSON string of board numbers
+    board = models.BinaryField(max_length=engine.CELL_COUNT, default=b'', blank=True)  # one byte per cell, 0 = empty
     is_host = models.BooleanField(default=False)
     is_connected = models.BooleanField(default=True)
     is_ready = models.BooleanField(default=False)
     joined_at = models.DateTimeField(auto_now_add=True)
 
     def set_board(self, board_numbers):
-        self.board_state = json.dumps(board_numbers)
-        self.save()
+        self.board = encode_board(board_numbers)
+        self.save(update_fields=['board'])
 
     def get_board(self):
-        if self.board_state:
-            return json.loads(self.board_state)
-        return []
+        return decode_board(self.board)
 
     def __str__(self):
         return f"{self.name} in {self.room.code}"
 
     class Meta:
-        unique_together = ['room', 'name']
\ No newline at end of file
+        unique_together = ['room', 'name']
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from . import metrics
+from .background import BackgroundLoop
+from .db import CRITICAL, db_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue(BackgroundLoop):
+    """
+    Coalescing write-behind queue for Room/Player rows.
+
+    Updates are keyed by (model, lookup); repeated updates to the same row
+    before a flush are merged so only the latest value of each field is
+    written. Inserts (e.g. Draw rows) are appended and bulk-created. All
+    pending rows are written in a single thread hop.
+
+    Bursty edits (board filling) can be debounced: they are held back until
+    no new edit has arrived for `delay` seconds, or until the next flush().
+
+    A batch is written in one transaction, so a room's update and its new
+    Draw rows land together. If it fails (e.g. the database stays locked)
+    the whole batch goes back in the queue and is retried after
+    `retry_delay` seconds; memory stays authoritative meanwhile. Only rows
+    that can never be written are dropped: inserts whose parent row is gone
+    or that an earlier attempt already wrote.
+    """
+
+    def __init__(self, interval=None, retry_delay=1.0):
+        super().__init__()
+        self.interval = interval if interval is not None else getattr(
+            settings, 'BINGO_WRITE_BEHIND_INTERVAL', 0.05
+        )
+        self._pending = {}
+        self._debounced = {}
+        self._creates = []
+        self._flush_lock = None
+        self.retry_delay = retry_delay
+
+    def enqueue_update(self, model, lookup, **fields):
+        """Queue an UPDATE of `fields` on the rows matching `lookup`"""
+        key = (model, tuple(sorted(lookup.items())))
+        if key in self._pending:
+            self._pending[key].update(fields)
+        else:
+            self._pending[key] = dict(fields)
+        self.wake()
+
+    def debounce(self, model, lookup, delay, **fields):
+        """Like enqueue_update, but only queued once the row has been quiet for `delay` seconds"""
+        key = (model, tuple(sorted(lookup.items())))
+        previous = self._debounced.get(key)
+        if previous is not None:
+            previous[1].cancel()
+            fields = {**previous[0], **fields}
+        handle = asyncio.get_running_loop().call_later(delay, self._promote, key)
+        self._debounced[key] = (fields, handle)
+
+    def _promote(self, key):
+        entry = self._debounced.pop(key, None)
+        if entry is not None:
+            entry[1].cancel()
+            model, lookup = key
+            self.enqueue_update(model, dict(lookup), **entry[0])
+
+    def enqueue_create(self, model, **fields):
+        """Queue an INSERT of a new `model` row"""
+        self._creates.append((model, fields))
+        self.wake()
+
+    def discard(self, model, **lookup):
+        """Drop pending writes for a row that is about to be deleted"""
+        key = (model, tuple(sorted(lookup.items())))
+        self._pending.pop(key, None)
+        entry = self._debounced.pop(key, None)
+        if entry is not None:
+            entry[1].cancel()
+
+    def discard_creates(self, model, **fields):
+        """Drop pending inserts of `model` whose fields match, e.g. rows of a deleted room"""
+        self._creates = [
+            (m, f) for m, f in self._creates
+            if m is not model or any(f.get(k) != v for k, v in fields.items())
+        ]
+
+    async def flush(self):
+        """Write everything that is pending, waiting for a batch already in flight"""
+        for key in list(self._debounced):
+            self._promote(key)
+        self.ensure_running()
+        async with self._flush_lock:
+            if not self._pending and not self._creates:
+                return
+            batch, self._pending = self._pending, {}
+            creates, self._creates = self._creates, []
+            try:
+                try:
+                    await self._apply(batch, creates)
+                except IntegrityError:
+                    # A foreign key failed at commit: write again, checking each insert as it goes
+                    await self._apply(batch, creates, strict=True)
+            except Exception as e:
+                logger.error(f"Write-behind batch of {len(batch)} update(s) and {len(creates)} insert(s) failed, retrying: {str(e)}")
+                self._requeue(batch, creates)
+                asyncio.get_running_loop().call_later(self.retry_delay, self.wake)
+
+    def _requeue(self, batch, creates):
+        """Put a failed batch back ahead of what was queued since; newer field values win"""
+        for key, fields in batch.items():
+            self._pending[key] = {**fields, **self._pending.get(key, {})}
+        self._creates = creates + self._creates
+
+    @property
+    def pending_count(self):
+        return len(self._pending) + len(self._debounced) + len(self._creates)
+
+    def on_start(self):
+        self._flush_lock = asyncio.Lock()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Give concurrent moves a moment to land in the same batch
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing write-behind queue: {str(e)}")
+
+    @db_sync_to_async(priority=CRITICAL)
+    def _apply(self, batch, creates, strict=False):
+        """
+        Write a batch in one transaction; any error but an unwritable insert
+        fails it whole. Foreign keys are only checked at commit unless
+        `strict`, which checks them after each insert (a table scan on SQLite).
+        """
+        with transaction.atomic():
+            for (model, lookup), fields in batch.items():
+                # An update of a deleted row matches nothing; it needs no special case
+                model.objects.filter(**dict(lookup)).update(**fields)
+
+            by_model = {}
+            for model, fields in creates:
+                by_model.setdefault(model, []).append(fields)
+            for model, rows in by_model.items():
+                try:
+                    self._insert(model, rows, strict)
+                except IntegrityError:
+                    # Find the rows that can't be written and keep the rest
+                    for fields in rows:
+                        try:
+                            self._insert(model, [fields], strict)
+                        except IntegrityError as e:
+                            logger.warning(f"Dropping write-behind insert of {model.__name__} {fields}: {str(e)}")
+
+    @staticmethod
+    def _insert(model, rows, strict):
+        with transaction.atomic():
+            model.objects.bulk_create([model(**fields) for fields in rows])
+            if strict:
+                connection.check_constraints(table_names=[model._meta.db_table])
+
+
+write_behind = WriteBehindQueue()
+
+metrics.register(metrics.Gauge(
+    'bingo_write_behind_pending', 'Rows waiting in the write-behind queue',
+    lambda: write_behind.pending_count,
+))
@@ -0,0 +1,116 @@
+"""
+Reference-counted presence per room.
+
+Every accepted socket holds one reference on its (room, player). A player
+counts as gone only when their last socket closes, and a room only when its
+last player is gone; the cleanup scheduler then gives the room a grace
+period, and any reconnect during it cancels the cleanup. A page reload or
+a mass reconnect after a deploy therefore never deletes a live room.
+
+Counts are kept in memory, or in Redis when several workers share rooms
+(BINGO_PRESENCE_REDIS_URL) so that a socket on any worker keeps the room alive.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class LocalCounts:
+    """Socket counts for this process only"""
+
+    def __init__(self):
+        self._rooms = {}
+
+    async def incr(self, code, name):
+        players = self._rooms.setdefault(code, {})
+        players[name] = players.get(name, 0) + 1
+        return players[name]
+
+    async def decr(self, code, name):
+        """Drop one reference; returns (player's sockets left, players left in the room)"""
+        players = self._rooms.get(code, {})
+        count = players.get(name, 0) - 1
+        if count > 0:
+            players[name] = count
+        else:
+            players.pop(name, None)
+            count = 0
+        if not players:
+            self._rooms.pop(code, None)
+        return count, len(players)
+
+    async def players(self, code):
+        return len(self._rooms.get(code, ()))
+
+    async def clear(self, code):
+        self._rooms.pop(code, None)
+
+
+# KEYS[1] = room hash, ARGV[1] = player: decrement, drop the field at zero, report both counts
+DECR_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if count <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    count = 0
+end
+return {count, redis.call('HLEN', KEYS[1])}
+"""
+
+
+class RedisCounts:
+    """Socket counts shared by every worker through one Redis hash per room"""
+
+    def __init__(self, url, ttl=86400):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImproperlyConfigured('BINGO_PRESENCE_REDIS_URL is set but the redis package is not installed')
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self._decr = self.client.register_script(DECR_SCRIPT)
+
+    def key(self, code):
+        return f'bingo:presence:{code}'
+
+    async def incr(self, code, name):
+        key = self.key(code)
+        async with self.client.pipeline(transaction=True) as pipe:
+            # The TTL only guards against keys orphaned by crashed workers
+            count, _ = await pipe.hincrby(key, name, 1).expire(key, self.ttl).execute()
+        return count
+
+    async def decr(self, code, name):
+        count, players = await self._decr(keys=[self.key(code)], args=[name])
+        return int(count), int(players)
+
+    async def players(self, code):
+        return await self.client.hlen(self.key(code))
+
+    async def clear(self, code):
+        await self.client.delete(self.key(code))
+
+
+class PresenceTracker:
+    def __init__(self, counts=None):
+        if counts is None:
+            url = settings.BINGO_PRESENCE_REDIS_URL
+            counts = RedisCounts(url) if url else LocalCounts()
+        self.counts = counts
+
+    async def join(self, code, name):
+        """Count a new socket for `name`"""
+        return await self.counts.incr(code, name)
+
+    async def leave(self, code, name):
+        """Release a socket of `name`. Returns (player_gone, room_empty)"""
+        sockets, players = await self.counts.decr(code, name)
+        return sockets == 0, players == 0
+
+    async def occupied(self, code):
+        """Whether any worker still holds a socket for the room"""
+        return bool(await self.counts.players(code))
+
+    async def clear(self, code):
+        await self.counts.clear(code)
+
+
+presence = PresenceTracker()
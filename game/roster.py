@@ -0,0 +1,85 @@
+import asyncio
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import wire
+
+JOINED = 'joined'
+LEFT = 'left'
+READY = 'ready'
+
+
+class RosterDelta:
+    """Roster changes collected for one room during a coalescing window"""
+
+    __slots__ = ('state', 'group', 'changes', 'handle')
+
+    def __init__(self, state, group):
+        self.state = state
+        self.group = group
+        self.changes = {JOINED: {}, LEFT: {}, READY: {}}
+        self.handle = None
+
+    def add(self, change, name):
+        self.changes[change][name] = None
+
+    def payload(self):
+        names = {name: None for names in self.changes.values() for name in names}
+        by_name = self.state.by_name
+        return {
+            'type': 'roster_update',
+            JOINED: list(self.changes[JOINED]),
+            LEFT: list(self.changes[LEFT]),
+            READY: list(self.changes[READY]),
+            # Current entries of every player that changed; clients merge them into their roster
+            'players': [by_name[name].as_dict() for name in names if name in by_name],
+        }
+
+
+class RosterCoalescer:
+    """
+    Merges join, leave and ready changes per room over a short window and
+    broadcasts them as one roster_update, so a class joining at once costs
+    one message per socket rather than one per pair of players. Turn events
+    don't go through here; callers flush() a room before broadcasting one
+    that the roster must precede (e.g. game start).
+    """
+
+    def __init__(self, window_ms=None):
+        window_ms = settings.BINGO_ROSTER_COALESCE_MS if window_ms is None else window_ms
+        self.window = window_ms / 1000
+        self._pending = {}
+
+    async def note(self, state, group, change, name):
+        """Record a roster change for the room; broadcast at once when coalescing is off"""
+        delta = self._pending.get(state.code)
+        if delta is None:
+            delta = self._pending[state.code] = RosterDelta(state, group)
+            if self.window > 0:
+                delta.handle = asyncio.get_running_loop().call_later(self.window, self._fire, state.code)
+        delta.add(change, name)
+        if self.window <= 0:
+            await self.flush(state.code)
+
+    def _fire(self, code):
+        asyncio.ensure_future(self.flush(code))
+
+    async def flush(self, code):
+        """Broadcast the room's pending changes now, if any"""
+        delta = self._pending.pop(code, None)
+        if delta is None:
+            return
+        if delta.handle is not None:
+            delta.handle.cancel()
+        await get_channel_layer().group_send(delta.group, {
+            'type': 'roster_update',
+            'text': wire.dumps(delta.payload()),
+        })
+
+    def discard(self, code):
+        """Drop pending changes for a room that is going away"""
+        delta = self._pending.pop(code, None)
+        if delta is not None and delta.handle is not None:
+            delta.handle.cancel()
+
+
+roster = RosterCoalescer()
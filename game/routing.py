@@ -2,5 +2,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
-    re_path(r'^ws/game/(?P<room_code>\w+)/$', consumers.BingoConsumer.as_asgi()),
+    re_path(r'^ws/(?:s(?P<shard>\d+)/)?game/(?P<room_code>\w+)/$', consumers.BingoConsumer.as_asgi()),
+    re_path(r'^ws/(?:s(?P<shard>\d+)/)?game/(?P<room_code>\w+)/watch/$', consumers.SpectatorConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""
+Room-sharded mode.
+
+With BINGO_SHARDS > 1, every room code maps to exactly one worker process
+(its shard), which holds the room's state and all of its sockets. Group
+messages then never leave the process. Clients connect to
+/ws/s<shard>/game/<code>/ so any path-prefix proxy can route them; the
+`runshards` command starts the workers behind a small local router.
+"""
+import logging
+import re
+import zlib
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WS_PATH = re.compile(r'^/ws/(?:s(?P<shard>\d+)/)?game/(?P<room_code>\w+)/(?:watch/)?$')
+
+# WebSocket close code for a room owned by another shard
+CLOSE_WRONG_SHARD = 4002
+
+
+def is_sharded():
+    return settings.BINGO_SHARDS > 1
+
+
+def shard_for(room_code, shards=None):
+    """The shard owning `room_code`: stable across processes and restarts"""
+    shards = shards or settings.BINGO_SHARDS
+    return zlib.crc32(room_code.upper().encode()) % shards
+
+
+def ws_path(room_code):
+    """Path the browser connects to for `room_code`"""
+    if is_sharded():
+        return f'/ws/s{shard_for(room_code)}/game/{room_code}/'
+    return f'/ws/game/{room_code}/'
+
+
+def watch_path(room_code):
+    """Path a spectator connects to for `room_code`"""
+    return f'{ws_path(room_code)}watch/'
+
+
+def shard_from_path(path, shards=None):
+    """Shard a WebSocket path belongs to, or None for anything that isn't a game or spectator socket"""
+    match = WS_PATH.match(path)
+    if match is None:
+        return None
+    return shard_for(match['room_code'], shards)
+
+
+class ShardGuardMiddleware:
+    """
+    ASGI wrapper for a shard worker: refuses game sockets for rooms owned by
+    another shard, so a misrouted client can't split a room across processes.
+    A no-op unless this process has a BINGO_SHARD_INDEX.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        index = settings.BINGO_SHARD_INDEX
+        if scope['type'] == 'websocket' and is_sharded() and index is not None:
+            shard = shard_from_path(scope['path'])
+            if shard is not None and shard != index:
+                logger.warning(f"Rejecting {scope['path']} on shard {index}: owned by shard {shard}")
+                await receive()  # websocket.connect
+                await send({'type': 'websocket.close', 'code': CLOSE_WRONG_SHARD})
+                return
+        return await self.app(scope, receive, send)
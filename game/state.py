@@ -0,0 +1,558 @@
+import asyncio
+import logging
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from . import engine, events, metrics
+from .db import NORMAL, db_sync_to_async
+from .events import event_log
+from .models import Room, Player, Draw, encode_board
+from .persistence import write_behind
+
+logger = logging.getLogger(__name__)
+
+
+class PlayerSlot:
+    """A player's seat in a live room. Slots are numbered in join order."""
+
+    __slots__ = ('slot', 'player_id', 'name', 'is_host', 'is_connected', 'is_ready', 'board')
+
+    def __init__(self, slot, name, is_host=False, is_connected=True, is_ready=False, board=None, player_id=None):
+        self.slot = slot
+        self.player_id = player_id
+        self.name = name
+        self.is_host = is_host
+        self.is_connected = is_connected
+        self.is_ready = is_ready
+        self.board = board or []
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'slot': self.slot,
+            'is_host': self.is_host,
+            'is_connected': self.is_connected,
+            'is_ready': self.is_ready,
+        }
+
+
+class RoomState:
+    """
+    Authoritative in-memory state of a live room.
+
+    Drawn numbers are kept both as a 25-bit mask (bit n-1 set when n has
+    been called) for O(1) membership checks and as an ordered list for
+    display. The turn ring is the list of player slots in join order;
+    `turn_slot` points at the player whose turn it is.
+
+    All mutations are synchronous, so a check-and-update runs atomically
+    on the event loop. Changes are persisted through the write-behind queue
+    and appended to the room's event log.
+    """
+
+    __slots__ = (
+        'room_id', 'code', 'host_name', 'game_started', 'auto_detect_winner', 'winner', 'drawn_mask', 'drawn',
+        'current_number', 'slots', 'by_name', 'turn_slot', 'cards', 'version', '_pending_turn',
+    )
+
+    def __init__(self, room_id, code, host_name, game_started=False, drawn=None,
+                 current_number=None, current_turn_player='', auto_detect_winner=False, version=0, winner=None):
+        self.room_id = room_id
+        self.code = code
+        self.host_name = host_name
+        self.game_started = game_started
+        self.auto_detect_winner = auto_detect_winner
+        self.winner = winner
+        self.drawn = []
+        self.drawn_mask = 0
+        for number in drawn or []:
+            self.drawn.append(number)
+            self.drawn_mask |= 1 << (number - 1)
+        self.current_number = current_number
+        self.slots = []
+        self.by_name = {}
+        self.turn_slot = None
+        self.cards = {}
+        self.version = version
+        self._pending_turn = current_turn_player
+
+    # -- players -----------------------------------------------------------
+
+    def add_player(self, name, is_host=False, is_connected=True, is_ready=False, board=None, player_id=None):
+        player = self.by_name.get(name)
+        if player is None:
+            player = PlayerSlot(len(self.slots), name, is_host, is_connected, is_ready, board, player_id)
+            self.slots.append(player)
+            self.by_name[name] = player
+            self._update_card(player)
+            if self._pending_turn == name:
+                self.turn_slot = player.slot
+        else:
+            player.is_connected = is_connected
+        return player
+
+    def set_board(self, name, board):
+        """
+        Replace a player's board. The write to Player.board is debounced so
+        filling a board cell by cell costs one UPDATE rather than 25.
+        """
+        player = self.replace_board(name, board)
+        if player is not None:
+            write_behind.debounce(
+                Player, {'pk': player.player_id}, settings.BINGO_BOARD_SAVE_DELAY,
+                board=encode_board(board),
+            )
+            event_log.record(self, events.FILL, name, board)
+
+    def replace_board(self, name, board):
+        """Replace a player's board in memory only; returns their slot"""
+        player = self.by_name.get(name)
+        if player is not None:
+            player.board = board
+            self._update_card(player)
+        return player
+
+    def _update_card(self, player):
+        # Only complete boards take part in scoring
+        if engine.is_full_board(player.board):
+            self.cards[player.name] = engine.Scorecard(player.board, self.drawn_mask)
+        else:
+            self.cards.pop(player.name, None)
+
+    def set_connected(self, name, is_connected):
+        player = self.by_name.get(name)
+        if player is not None:
+            player.is_connected = is_connected
+            write_behind.enqueue_update(
+                Player, {'room__code': self.code, 'name': name}, is_connected=is_connected
+            )
+            self.touch()
+            if is_connected:
+                event_log.record(self, events.JOIN, name, player.is_host, player.player_id)
+            else:
+                event_log.record(self, events.LEAVE, name)
+
+    def set_ready(self, name):
+        player = self.by_name.get(name)
+        if player is None:
+            return False
+        player.is_ready = True
+        write_behind.enqueue_update(
+            Player, {'room__code': self.code, 'name': name}, is_ready=True
+        )
+        self.touch()
+        event_log.record(self, events.READY, name)
+        return True
+
+    def touch(self):
+        """Record activity in the room, so the stale-room purge leaves it alone"""
+        write_behind.enqueue_update(Room, {'code': self.code}, last_activity=timezone.now())
+
+    def connected_players(self):
+        return [p for p in self.slots if p.is_connected]
+
+    def players_data(self):
+        return [p.as_dict() for p in self.slots]
+
+    def ready_status(self):
+        return [{'name': p.name, 'is_ready': p.is_ready} for p in self.slots if p.is_connected]
+
+    def not_ready_players(self):
+        return [p.name for p in self.slots if p.is_connected and not p.is_ready]
+
+    # -- turns and draws ---------------------------------------------------
+
+    @property
+    def current_turn_player(self):
+        if self.turn_slot is None:
+            return self._pending_turn or ''
+        return self.slots[self.turn_slot].name
+
+    def start(self):
+        """Start the game with the first connected player. Returns False if already started."""
+        if self.game_started:
+            return False
+        self.game_started = True
+        first = next((p for p in self.slots if p.is_connected), None)
+        if first is not None:
+            self.turn_slot = first.slot
+        write_behind.enqueue_update(
+            Room, {'code': self.code},
+            game_started=True, current_turn_player=self.current_turn_player,
+            last_activity=timezone.now(),
+        )
+        event_log.record(self, events.START, self.current_turn_player)
+        return True
+
+    def is_drawn(self, number):
+        return bool(self.drawn_mask >> (number - 1) & 1)
+
+    @property
+    def seq(self):
+        """Sequence number of the latest draw (1 for the first number called)"""
+        return len(self.drawn)
+
+    def drawn_set(self):
+        return set(self.drawn)
+
+    def lines_for(self, name):
+        """Complete lines on a player's board, or 0 if the board is not filled"""
+        card = self.cards.get(name)
+        return card.lines if card is not None else 0
+
+    def check_draw(self, number, player_name):
+        """Validate a draw attempt without applying it; returns an engine.DRAW_* outcome"""
+        if self.winner is not None or not isinstance(number, int) or not 1 <= number <= engine.CELL_COUNT:
+            return engine.DRAW_INVALID
+        if self.current_turn_player != player_name:
+            return engine.DRAW_NOT_YOUR_TURN
+        if self.is_drawn(number):
+            return engine.DRAW_ALREADY_CALLED
+        return engine.DRAW_OK
+
+    def draw(self, number, player_name):
+        """
+        Record `number` as called by `player_name` and advance the turn ring.
+        Returns an engine.DRAW_* outcome; nothing changes unless it is DRAW_OK.
+        """
+        result = self.apply_draw(number, player_name)
+        if result != engine.DRAW_OK:
+            return result
+        write_behind.enqueue_update(
+            Room, {'code': self.code},
+            drawn_mask=self.drawn_mask,
+            current_number=number,
+            current_turn_player=self.current_turn_player,
+            version=self.version,
+            last_activity=timezone.now(),
+        )
+        write_behind.enqueue_create(Draw, room_id=self.room_id, seq=self.seq, number=number)
+        event_log.record(self, events.DRAW, number, player_name, self.current_turn_player, self.version)
+        return result
+
+    def apply_draw(self, number, player_name):
+        """The in-memory part of draw(): validate, score and advance the turn"""
+        result = self.check_draw(number, player_name)
+        if result != engine.DRAW_OK:
+            return result
+        self._mark_drawn(number)
+        self._advance_turn()
+        self.version += 1
+        return result
+
+    def record_draw(self, number, current_turn_player, version):
+        """Apply a draw that has already been persisted (by this or another worker)"""
+        self._mark_drawn(number)
+        self.version = version
+        self._set_turn(current_turn_player)
+
+    def _set_turn(self, name):
+        player = self.by_name.get(name)
+        self.turn_slot = player.slot if player is not None else None
+        self._pending_turn = name
+
+    def sync_draw(self, seq, number, current_turn_player, version):
+        """
+        Apply a draw broadcast by another worker. Returns False if draws were
+        missed and the state needs to be reloaded.
+        """
+        if seq <= self.seq:
+            return True
+        if seq != self.seq + 1:
+            return False
+        self.record_draw(number, current_turn_player, version)
+        return True
+
+    def _mark_drawn(self, number):
+        self.drawn_mask |= 1 << (number - 1)
+        self.drawn.append(number)
+        self.current_number = number
+        engine.score_draw(self.cards, number)
+
+    def detect_winner(self, drawn_by):
+        """
+        Winner after the latest draw, or None. If several boards complete
+        on the same draw, the player who called the number wins, otherwise
+        the earliest seat.
+        """
+        if drawn_by in self.cards and self.cards[drawn_by].has_bingo:
+            return drawn_by
+        for player in self.slots:
+            card = self.cards.get(player.name)
+            if card is not None and card.has_bingo:
+                return player.name
+        return None
+
+    def declare_winner(self, name):
+        """Record the winner. Returns False if the game already has one."""
+        if self.winner is not None:
+            return False
+        self.winner = name
+        write_behind.enqueue_update(Room, {'code': self.code}, winner=name, last_activity=timezone.now())
+        event_log.record(self, events.WIN, name)
+        return True
+
+    def sync_start(self, current_turn_player):
+        """Apply a game start broadcast by another worker"""
+        if not self.game_started:
+            self.game_started = True
+            self._set_turn(current_turn_player)
+
+    def sync_winner(self, name):
+        """Apply a winner announced by another worker"""
+        if self.winner is None:
+            self.winner = name
+
+    def _advance_turn(self):
+        count = len(self.slots)
+        start = self.turn_slot if self.turn_slot is not None else -1
+        for step in range(1, count + 1):
+            candidate = self.slots[(start + step) % count]
+            if candidate.is_connected:
+                self.turn_slot = candidate.slot
+                return
+
+    def snapshot(self):
+        """Room data as sent to clients in game_init"""
+        return {
+            'host_name': self.host_name,
+            'game_started': self.game_started,
+            'current_number': self.current_number,
+            'drawn_numbers': list(self.drawn),
+            'seq': self.seq,
+            'players': self.players_data(),
+            'current_turn_player': self.current_turn_player,
+            'auto_detect_winner': self.auto_detect_winner,
+        }
+
+    # -- event log ---------------------------------------------------------
+
+    def to_record(self):
+        """Everything needed to rebuild this state, as JSON-ready data (an event log snapshot)"""
+        return {
+            'room_id': self.room_id,
+            'code': self.code,
+            'host_name': self.host_name,
+            'game_started': self.game_started,
+            'auto_detect_winner': self.auto_detect_winner,
+            'winner': self.winner,
+            'drawn': list(self.drawn),
+            'current_number': self.current_number,
+            'current_turn_player': self.current_turn_player,
+            'version': self.version,
+            'players': [
+                [p.name, p.is_host, p.is_connected, p.is_ready, p.board, p.player_id] for p in self.slots
+            ],
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        state = cls(
+            room_id=record['room_id'],
+            code=record['code'],
+            host_name=record['host_name'],
+            game_started=record['game_started'],
+            drawn=record['drawn'],
+            current_number=record['current_number'],
+            current_turn_player=record['current_turn_player'],
+            auto_detect_winner=record['auto_detect_winner'],
+            version=record['version'],
+            winner=record['winner'],
+        )
+        for name, is_host, is_connected, is_ready, board, player_id in record['players']:
+            state.add_player(name, is_host, is_connected, is_ready, board, player_id)
+        return state
+
+    def apply_event(self, event):
+        """Re-apply a logged event, without persisting or logging it again"""
+        kind, _, *args = event
+        if kind == events.JOIN:
+            name, is_host, player_id = args
+            self.add_player(name, is_host=is_host, player_id=player_id)
+        elif kind == events.LEAVE:
+            player = self.by_name.get(args[0])
+            if player is not None:
+                player.is_connected = False
+        elif kind == events.FILL:
+            self.replace_board(*args)
+        elif kind == events.READY:
+            player = self.by_name.get(args[0])
+            if player is not None:
+                player.is_ready = True
+        elif kind == events.START:
+            self.game_started = True
+            self._set_turn(args[0])
+        elif kind == events.DRAW:
+            number, _, current_turn_player, version = args
+            self.record_draw(number, current_turn_player, version)
+        elif kind == events.WIN:
+            self.winner = args[0]
+
+
+def group_name(code):
+    """Channel layer group of a room's sockets"""
+    return f'bingo_{code}'
+
+
+# Live rooms owned by this process, keyed by room code
+_rooms = {}
+_load_locks = {}
+# Sockets of this process attached to each live room
+_holds = {}
+
+metrics.register(metrics.Gauge('bingo_live_rooms', 'Rooms held in memory by this process', lambda: len(_rooms)))
+
+
+# Fetches everything a RoomState needs alongside the Room: 3 queries in total
+ROOM_PREFETCH = (
+    Prefetch('players', queryset=Player.objects.order_by('id')),
+    Prefetch('draws', queryset=Draw.objects.order_by('seq')),
+)
+
+
+def load_room_state(code):
+    """Build a RoomState from the database (sync)"""
+    try:
+        room = Room.objects.prefetch_related(*ROOM_PREFETCH).get(code=code)
+    except Room.DoesNotExist:
+        return None
+    return build_room_state(room)
+
+
+def recover_room_state(code):
+    """
+    Rebuild a room from its event log (sync): the last snapshot plus the
+    events after it. The log is only trusted when it agrees with the room
+    row's version, i.e. no draw was persisted that the log missed or the
+    other way round; otherwise None, and the room is loaded from the database.
+    """
+    if not event_log.enabled:
+        return None
+    record, tail = events.tail(event_log.read(code))
+    if record is None:
+        return None
+    state = RoomState.from_record(record)
+    for event in tail:
+        state.apply_event(event)
+    row = Room.objects.filter(code=code).values_list('pk', 'version').first()
+    if row != (state.room_id, state.version):
+        return None
+    return state
+
+
+def recover_or_load_room_state(code):
+    """A room from its event log when that can be trusted, else from the database (sync)"""
+    return recover_room_state(code) or load_room_state(code)
+
+
+def build_room_state(room):
+    """Build a RoomState from a Room fetched with ROOM_PREFETCH"""
+    state = RoomState(
+        room_id=room.pk,
+        code=room.code,
+        host_name=room.host_name,
+        game_started=room.game_started,
+        drawn=[draw.number for draw in room.draws.all()],
+        current_number=room.current_number,
+        current_turn_player=room.current_turn_player,
+        auto_detect_winner=room.auto_detect_winner,
+        version=room.version,
+        winner=room.winner or None,
+    )
+    for player in room.players.all():
+        state.add_player(
+            player.name,
+            is_host=player.is_host,
+            is_connected=player.is_connected,
+            is_ready=player.is_ready,
+            board=player.get_board(),
+            player_id=player.pk,
+        )
+    return state
+
+
+def live_room_codes():
+    """Codes of the rooms this process holds in memory"""
+    return list(_rooms)
+
+
+def peek_room_state(code):
+    """The live RoomState for `code` if this process already holds it"""
+    return _rooms.get(code)
+
+
+def install_room_state(state):
+    """Register a freshly loaded RoomState; returns the one now registered for its room"""
+    installed = _rooms.setdefault(state.code, state)
+    if installed is state:
+        event_log.open(state)
+    return installed
+
+
+async def get_room_state(code):
+    """Return the live RoomState for `code`, loading it from the database on first use"""
+    state = _rooms.get(code)
+    if state is not None:
+        return state
+
+    lock = _load_locks.setdefault(code, asyncio.Lock())
+    async with lock:
+        state = _rooms.get(code)
+        if state is None:
+            state = await db_sync_to_async(recover_or_load_room_state)(code)
+            if state is not None:
+                _rooms[code] = state
+                event_log.open(state)
+                logger.debug(f"Loaded state for room {code}")
+    _load_locks.pop(code, None)
+    return state
+
+
+async def refresh_room_state(code, priority=NORMAL):
+    """
+    Reload a live room from the database in place, so consumers holding the
+    RoomState see the fresh data. Used in shared-state mode, where other
+    workers may have changed the room.
+    """
+    state = _rooms.get(code)
+    await write_behind.flush()
+    fresh = await db_sync_to_async(load_room_state, priority=priority)(code)
+    if state is None or fresh is None:
+        return fresh
+    winner = state.winner
+    for attr in RoomState.__slots__:
+        setattr(state, attr, getattr(fresh, attr))
+    state.winner = state.winner or winner
+    return state
+
+
+def hold_room_state(code):
+    """Count a socket attached to the room's live state"""
+    _holds[code] = _holds.get(code, 0) + 1
+
+
+def release_room_state(code):
+    """
+    Release a socket's hold on a room. In shared-state mode a room no socket
+    of this process is attached to is forgotten: other workers keep changing
+    it, and any worker may be the one that deletes it, so a copy kept here
+    would only go stale. The next socket reloads it.
+    """
+    count = _holds.get(code, 0) - 1
+    if count > 0:
+        _holds[code] = count
+        return
+    _holds.pop(code, None)
+    if settings.BINGO_SHARED_STATE and _rooms.pop(code, None) is not None:
+        logger.debug(f"Released state for room {code}")
+
+
+def discard_room_state(code):
+    """Forget a room's live state and any writes still queued for it"""
+    state = _rooms.pop(code, None)
+    write_behind.discard(Room, code=code)
+    if state is not None:
+        write_behind.discard_creates(Draw, room_id=state.room_id)
+        for player in state.slots:
+            write_behind.discard(Player, room__code=code, name=player.name)
+            write_behind.discard(Player, pk=player.player_id)
@@ -1,3 +1,278 @@
-from django.test import TestCase
+import json
+import random
+from unittest import mock, skipIf
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from . import engine, routing, wire
+from .consumers import BingoConsumer
+from .events import event_log
+from .models import Draw, Room, Player, encode_board
+from .persistence import WriteBehindQueue
+from .state import discard_room_state, install_room_state, load_room_state
+from .tickets import issue_ticket
 
-# Create your tests here.
+# Board a wins on after numbers 1..21 are drawn in order; B_BOARD after 1..17
+A_BOARD = list(range(1, 26))
+B_BOARD = [2, 13, 21, 19, 25, 15, 7, 22, 18, 23, 3, 8, 17, 12, 14, 11, 9, 16, 4, 1, 5, 6, 24, 20, 10]
+
+
+class RecordingConsumer(BingoConsumer):
+    """A consumer detached from any socket: sent frames are collected"""
+
+    def __init__(self, room_code, room_state):
+        super().__init__()
+        self.room_code = room_code
+        self.room_state = room_state
+        self.sent = []
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.sent.append(text_data if text_data is not None else bytes_data)
+
+
+@override_settings(BINGO_SHARED_STATE=True)
+class SharedStateStartTests(TransactionTestCase):
+    code = 'SHARE1'
+
+    def setUp(self):
+        # As in a shared-state deployment, no worker keeps an event log
+        self.enterContext(mock.patch.object(event_log, 'directory', ''))
+
+    def tearDown(self):
+        discard_room_state(self.code)
+
+    def test_game_started_loads_boards_readied_on_other_workers(self):
+        room = Room.objects.create(code=self.code, host_name='a')
+        Player.objects.create(room=room, name='a', is_host=True, is_ready=True, board=encode_board(A_BOARD))
+        b = Player.objects.create(room=room, name='b')
+        # This worker loaded the room before b filled their board
+        state = install_room_state(load_room_state(self.code))
+        self.assertNotIn('b', state.cards)
+
+        # b fills and readies through another worker, which starts the game
+        Player.objects.filter(pk=b.pk).update(board=encode_board(B_BOARD), is_ready=True)
+        Room.objects.filter(pk=room.pk).update(game_started=True, current_turn_player='a')
+        consumer = RecordingConsumer(self.code, state)
+        async_to_sync(consumer.game_started)({'type': 'game_started', 'text': '{}', 'current_turn_player': 'a'})
+
+        self.assertEqual(consumer.sent, ['{}'])
+        self.assertTrue(state.game_started)
+        self.assertIn('b', state.cards)
+        # Draws applied here afterwards score b's board too, so this worker sees b win first
+        players = ['a', 'b']
+        for seq, number in enumerate(range(1, 18), start=1):
+            state.sync_draw(seq, number, players[seq % 2], state.version + 1)
+        self.assertEqual(state.detect_winner('a'), 'b')
+
+
+class BinarySubprotocolTests(TransactionTestCase):
+    code = 'BIN001'
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(event_log, 'directory', ''))
+        Room.objects.create(code=self.code, host_name='a')
+
+    def tearDown(self):
+        discard_room_state(self.code)
+
+    async def negotiate(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(routing.websocket_urlpatterns),
+            f'/ws/game/{self.code}/?ticket={issue_ticket("a", self.code, True)}',
+            subprotocols=[wire.BINARY_SUBPROTOCOL],
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+        return subprotocol
+
+    async def test_binary_frames_negotiated(self):
+        self.assertEqual(await self.negotiate(), wire.BINARY_SUBPROTOCOL)
+
+    @override_settings(BINGO_SHARED_STATE=True)
+    async def test_shared_state_sockets_stay_json(self):
+        # Each worker numbers slots in its own join order, so frames can't name players
+        self.assertIsNone(await self.negotiate())
+
+
+class WriteBehindTests(TransactionTestCase):
+
+    def setUp(self):
+        self.queue = WriteBehindQueue(retry_delay=60)
+        self.room = Room.objects.create(code='WB0001', host_name='a')
+
+    def queue_draw(self, room_id, seq, number):
+        self.queue.enqueue_update(Room, {'pk': room_id}, drawn_mask=1 << (number - 1))
+        self.queue.enqueue_create(Draw, room_id=room_id, seq=seq, number=number)
+
+    async def test_failed_batch_is_kept_and_retried_whole(self):
+        self.queue_draw(self.room.pk, 1, 5)
+        with mock.patch.object(WriteBehindQueue, '_insert', side_effect=OperationalError('database is locked')):
+            await self.queue.flush()
+        # The room's update was rolled back with its draw, and both wait for the retry
+        self.assertEqual(self.queue.pending_count, 2)
+        await self.queue.flush()
+        self.assertEqual(self.queue.pending_count, 0)
+        room = await Room.objects.aget(pk=self.room.pk)
+        self.assertEqual(room.drawn_mask, 1 << 4)
+        self.assertEqual([d async for d in Draw.objects.values_list('seq', 'number')], [(1, 5)])
+
+    async def test_inserts_for_deleted_rooms_are_dropped(self):
+        gone = await Room.objects.acreate(code='WB0002', host_name='b')
+        self.queue_draw(gone.pk, 1, 7)
+        self.queue_draw(self.room.pk, 1, 5)
+        await gone.adelete()
+        await self.queue.flush()
+        self.assertEqual(self.queue.pending_count, 0)
+        self.assertEqual([d async for d in Draw.objects.values_list('room_id', 'number')], [(self.room.pk, 5)])
+
+
+class AdvanceTurnTests(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(code='TURN01', host_name='a', game_started=True, current_turn_player='a')
+        for name in ('a', 'b', 'c'):
+            Player.objects.create(room=self.room, name=name, is_host=name == 'a', is_connected=name != 'c')
+
+    def draws(self):
+        return list(Draw.objects.filter(room=self.room).values_list('seq', 'number'))
+
+    def test_draw_records_number_and_passes_turn(self):
+        result, room = Room.advance_turn('TURN01', 'a', 7)
+        self.assertEqual(result, engine.DRAW_OK)
+        room.refresh_from_db()
+        self.assertEqual(room.drawn_mask, 1 << 6)
+        self.assertEqual(room.current_number, 7)
+        # c is disconnected, so the turn goes a -> b -> a
+        self.assertEqual(room.current_turn_player, 'b')
+        self.assertEqual(room.version, self.room.version + 1)
+        self.assertEqual(Room.advance_turn('TURN01', 'b', 8)[1].current_turn_player, 'a')
+        self.assertEqual(self.draws(), [(1, 7), (2, 8)])
+
+    def test_not_your_turn(self):
+        result, room = Room.advance_turn('TURN01', 'b', 7)
+        self.assertEqual(result, engine.DRAW_NOT_YOUR_TURN)
+        room.refresh_from_db()
+        self.assertEqual((room.drawn_mask, room.current_turn_player, room.version), (0, 'a', self.room.version))
+        self.assertEqual(self.draws(), [])
+
+    def test_already_called(self):
+        Room.advance_turn('TURN01', 'a', 7)
+        result, room = Room.advance_turn('TURN01', 'b', 7)
+        self.assertEqual(result, engine.DRAW_ALREADY_CALLED)
+        room.refresh_from_db()
+        self.assertEqual(room.current_turn_player, 'b')
+        self.assertEqual(self.draws(), [(1, 7)])
+
+    def test_no_draws_after_a_winner(self):
+        Room.objects.filter(pk=self.room.pk).update(winner='b')
+        result, _ = Room.advance_turn('TURN01', 'a', 7)
+        self.assertEqual(result, engine.DRAW_INVALID)
+        self.assertEqual(self.draws(), [])
+
+    @skipIf(connection.features.has_select_for_update, 'compare-and-swap is only used without SELECT ... FOR UPDATE')
+    def test_stale_version_conflicts(self):
+        apply_draw = Room._apply_draw
+
+        def racing_apply_draw(room, player_name, number):
+            # Another worker's move lands between our read and our write
+            Room.objects.filter(pk=room.pk).update(version=room.version + 1, current_turn_player='b')
+            return apply_draw(room, player_name, number)
+
+        with mock.patch.object(Room, '_apply_draw', racing_apply_draw):
+            result, _ = Room.advance_turn('TURN01', 'a', 7)
+        self.assertEqual(result, engine.DRAW_CONFLICT)
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual((room.drawn_mask, room.current_turn_player), (0, 'b'))
+        self.assertEqual(self.draws(), [])
+
+
+class CompactDrawsMigrationTests(TransactionTestCase):
+    before = [('game', '0003_room_version')]
+    after = [('game', '0004_compact_draws_and_boards')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('game'))
+
+    def test_forwards_and_backwards(self):
+        apps = self.migrate(self.before)
+        OldRoom, OldPlayer = apps.get_model('game', 'Room'), apps.get_model('game', 'Player')
+        played = OldRoom.objects.create(code='MIG001', drawn_numbers='25,1,13')
+        fresh = OldRoom.objects.create(code='MIG002')
+        OldPlayer.objects.create(room=played, name='a', board_state=json.dumps(B_BOARD))
+        OldPlayer.objects.create(room=fresh, name='b')
+
+        apps = self.migrate(self.after)
+        Room, Player, Draw = (apps.get_model('game', name) for name in ('Room', 'Player', 'Draw'))
+        self.assertEqual(Room.objects.get(code='MIG001').drawn_mask, 1 << 24 | 1 | 1 << 12)
+        self.assertEqual(Room.objects.get(code='MIG002').drawn_mask, 0)
+        self.assertEqual(
+            list(Draw.objects.order_by('seq').values_list('room__code', 'seq', 'number')),
+            [('MIG001', 1, 25), ('MIG001', 2, 1), ('MIG001', 3, 13)],
+        )
+        self.assertEqual(bytes(Player.objects.get(name='a').board), bytes(B_BOARD))
+        self.assertEqual(bytes(Player.objects.get(name='b').board), b'')
+
+        apps = self.migrate(self.before)
+        OldRoom, OldPlayer = apps.get_model('game', 'Room'), apps.get_model('game', 'Player')
+        self.assertEqual(OldRoom.objects.get(code='MIG001').drawn_numbers, '25,1,13')
+        self.assertEqual(OldRoom.objects.get(code='MIG002').drawn_numbers, '')
+        self.assertEqual(json.loads(OldPlayer.objects.get(name='a').board_state), B_BOARD)
+        self.assertEqual(OldPlayer.objects.get(name='b').board_state, '')
+
+
+class ScorecardTests(SimpleTestCase):
+
+    def test_incremental_lines_match_a_full_recount(self):
+        rng = random.Random(1234)
+        for _ in range(200):
+            board = rng.sample(range(1, engine.CELL_COUNT + 1), engine.CELL_COUNT)
+            order = rng.sample(range(1, engine.CELL_COUNT + 1), engine.CELL_COUNT)
+            # Start some cards part-way through a game, as a reloaded room does
+            start = rng.randrange(engine.CELL_COUNT)
+            drawn_mask = engine.positions_mask(n - 1 for n in order[:start])
+            card = engine.Scorecard(board, drawn_mask)
+            self.assertEqual(card.lines, engine.count_lines(engine.marked_mask(board, drawn_mask)))
+            for number in order[start:]:
+                drawn_mask |= 1 << (number - 1)
+                lines = engine.count_lines(engine.marked_mask(board, drawn_mask))
+                self.assertEqual(card.mark(number), lines)
+                self.assertEqual(card.has_bingo, lines >= engine.WINNING_LINES)
+            self.assertEqual(card.lines, 12)
+
+    def test_centre_cell_completes_four_lines(self):
+        board = list(range(1, 26))
+        # Everything but the centre: no line through it is complete yet
+        card = engine.Scorecard(board, engine.FULL_MASK & ~(1 << 12))
+        self.assertEqual(len(engine.LINES_THROUGH_CELL[12]), 4)
+        self.assertEqual(card.lines, 12 - 4)
+        self.assertEqual(card.mark(13), 12)
+
+    def test_marking_again_changes_nothing(self):
+        card = engine.Scorecard(list(range(1, 26)))
+        for number in (1, 2, 3, 4):
+            card.mark(number)
+        self.assertEqual(card.mark(5), 1)
+        self.assertEqual((card.mark(5), card.marked), (1, 0b11111))
+
+    def test_numbers_off_the_board_are_ignored(self):
+        board = [0] + list(range(2, 26))
+        card = engine.Scorecard(board)
+        self.assertEqual(card.mark(1), 0)
+        self.assertEqual(card.marked, 0)
+
+    def test_score_draw_marks_every_card(self):
+        a = engine.Scorecard(A_BOARD, engine.positions_mask(range(4)))
+        b = engine.Scorecard(B_BOARD)
+        self.assertEqual(engine.score_draw({'a': a, 'b': b}, 5), {'a': 1, 'b': 0})
+        self.assertEqual(engine.marked_mask(B_BOARD, 1 << 4), b.marked)
+        self.assertEqual(engine.winners({'a': a, 'b': b}), [])
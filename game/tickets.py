@@ -0,0 +1,36 @@
+"""
+Signed room tickets.
+
+The room page hands the browser a ticket naming the player, the room and
+whether they host it, signed with SECRET_KEY and timestamped. The consumer
+checks it with an HMAC alone, so a handshake needs no session lookup; a
+socket without a valid ticket falls back to the session.
+"""
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.core import signing
+
+SALT = 'game.room-ticket'
+
+
+def issue_ticket(user_name, room_code, is_host=False):
+    return signing.dumps({'u': user_name, 'r': room_code, 'h': bool(is_host)}, salt=SALT, compress=True)
+
+
+def read_ticket(scope, room_code):
+    """
+    Identity carried by the socket's ?ticket=, as session-style data
+    ({'user_name', 'is_host'}), or None when there is no valid, unexpired
+    ticket for `room_code`.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    token = query.get('ticket', [None])[0]
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=SALT, max_age=settings.BINGO_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if data.get('r') != room_code or not data.get('u'):
+        return None
+    return {'user_name': data['u'], 'is_host': data.get('h', False)}
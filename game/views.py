@@ -1,6 +1,10 @@
 # game/views.py
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.shortcuts import render, redirect
+from django.http import HttpResponse, JsonResponse, Http404
+from . import metrics, sharding
+from .tickets import issue_ticket
+from .cache import room_cache, RoomInfo
+from .codes import allocator
 from .models import Room, Player
 
 def index(request):
@@ -8,36 +12,46 @@ def index(request):
 
 def health_check(request):
     """Health check endpoint for keep-alive services"""
-    return JsonResponse({'status': 'ok', 'message': 'Bingo server is running'})
+    return JsonResponse({
+        'status': 'ok',
+        'message': 'Bingo server is running',
+        'room_cache': room_cache.stats()
+    })
+
+def metrics_view(request):
+    """Server metrics in the Prometheus text format"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 def join_room(request):
     if request.method == "POST":
         name = request.POST.get('name').strip()
         room_code = request.POST.get('room_code').upper().strip()
         
-        try:
-            room = Room.objects.get(code=room_code, is_active=True)
-            
-            # Check if name already taken in this room
-            if Player.objects.filter(room=room, name=name).exists():
-                return render(request, 'index.html', {'error': f'Name "{name}" is already taken in this room'})
-            
-            request.session['user_name'] = name
-            request.session['room_code'] = room_code
-            request.session['is_host'] = False
-            
-            return redirect(f'/room/{room_code}/')
-        except Room.DoesNotExist:
+        room = room_cache.get_or_load(room_code)
+        if room is None or not room.is_active:
             return render(request, 'index.html', {'error': 'Room not found'})
+        
+        # Check if name already taken in this room (against the database:
+        # the player may have joined through another worker)
+        if Player.objects.filter(room__code=room_code, name=name).exists():
+            return render(request, 'index.html', {'error': f'Name "{name}" is already taken in this room'})
+        
+        request.session['user_name'] = name
+        request.session['room_code'] = room_code
+        request.session['is_host'] = False
+        
+        return redirect(f'/room/{room_code}/')
     
     return redirect('/')
 
 def create_room(request):
     if request.method == "POST":
         name = request.POST.get('name').strip()
+        auto_detect_winner = request.POST.get('auto_detect_winner') == 'on'
         
-        # Create a new Room with the host name
-        new_room = Room.objects.create(host_name=name)
+        # Create a new Room with the host name, under a code known to be free
+        new_room = Room.objects.create(code=allocator.take(), host_name=name, auto_detect_winner=auto_detect_winner)
+        room_cache.put(RoomInfo.from_room(new_room))
         
         request.session['user_name'] = name
         request.session['room_code'] = new_room.code
@@ -47,15 +61,29 @@ def create_room(request):
     
     return redirect('/')
 
+def watch(request, room_code):
+    """Read-only view of a room for spectators; no session needed"""
+    room = room_cache.get_or_load(room_code)
+    if room is None or not room.is_active:
+        return render(request, 'index.html', {'error': 'Room not found'})
+    return render(request, 'watch.html', {
+        'room_code': room_code,
+        'ws_path': sharding.watch_path(room_code),
+    })
+
 def room(request, room_code):
     if 'user_name' not in request.session:
         return redirect('/')
     
-    room = get_object_or_404(Room, code=room_code, is_active=True)
+    room = room_cache.get_or_load(room_code)
+    if room is None or not room.is_active:
+        raise Http404("Room not found")
     is_host = request.session.get('is_host', False)
     
     return render(request, 'room.html', {
         'room_code': room_code,
+        'ws_path': sharding.ws_path(room_code),
+        'ticket': issue_ticket(request.session['user_name'], room_code, is_host),
         'room': room,
         'user_name': request.session['user_name'],
         'is_host': is_host
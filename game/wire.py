@@ -0,0 +1,81 @@
+"""
+Encoding of client-facing messages.
+
+Broadcast payloads are encoded once by the sender and carried through the
+channel layer as text, so each consumer forwards them without re-encoding.
+The encoder is picked by settings.BINGO_JSON_ENCODER: 'orjson', 'json' or
+'auto' (orjson when it is installed, stdlib json otherwise).
+
+Clients that negotiate the BINARY_SUBPROTOCOL get game events (draws, game
+start, the win) as fixed 8-byte frames instead, encoded alongside the text
+by the sender: opcode, seq, number, player slot and turn slot, big-endian.
+Players are named by their slot index, which the JSON roster carries.
+Everything else, chat included, stays JSON.
+"""
+import json
+import logging
+import struct
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def _stdlib_dumps(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _load_encoder(name):
+    if name == 'json':
+        return _stdlib_dumps, 'json'
+
+    try:
+        import orjson
+    except ImportError:
+        if name == 'orjson':
+            raise ImproperlyConfigured("BINGO_JSON_ENCODER is 'orjson' but orjson is not installed")
+        return _stdlib_dumps, 'json'
+
+    def _orjson_dumps(payload):
+        return orjson.dumps(payload).decode()
+
+    return _orjson_dumps, 'orjson'
+
+
+_dumps, ENCODER_NAME = _load_encoder(getattr(settings, 'BINGO_JSON_ENCODER', 'auto'))
+logger.debug(f"Using {ENCODER_NAME} for client messages")
+
+
+def dumps(payload):
+    """Encode a client message to JSON text"""
+    return _dumps(payload)
+
+
+BINARY_SUBPROTOCOL = 'bingo.bin.v1'
+
+# opcode (u8), seq (u16), number (u8), slot (u16), turn slot (u16)
+FRAME = struct.Struct('!BHBHH')
+NUMBER_CALLED = 1   # seq, number, slot = who called it, turn = whose turn is next
+GAME_STARTED = 2    # turn = who plays first
+BINGO_WINNER = 3    # slot = the winner
+NO_SLOT = 0xFFFF
+
+
+def frame(opcode, seq=0, number=0, slot=None, turn=None):
+    """Encode a game event as a binary frame; slots are PlayerSlot.slot indexes or None"""
+    return FRAME.pack(opcode, seq, number, NO_SLOT if slot is None else slot, NO_SLOT if turn is None else turn)
+
+
+def decode_frame(data, names):
+    """The JSON message a binary frame stands for; `names` maps slot indexes to player names"""
+    opcode, seq, number, slot, turn = FRAME.unpack(data)
+    if opcode == NUMBER_CALLED:
+        return {
+            'type': 'number_called', 'seq': seq, 'number': number,
+            'selected_by': names.get(slot, ''), 'current_turn_player': names.get(turn, ''),
+        }
+    if opcode == GAME_STARTED:
+        return {'type': 'game_started', 'current_turn_player': names.get(turn, '')}
+    if opcode == BINGO_WINNER:
+        return {'type': 'bingo_winner', 'winner': names.get(slot, '')}
+    raise ValueError(f"Unknown frame opcode {opcode}")